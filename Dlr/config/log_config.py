@@ -1,59 +1,155 @@
+import atexit
 import logging
+import queue
 import sys
+import time
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 
 
 class DefaultFormatter(logging.Formatter):
-    COLORS = {
-        logging.DEBUG: '\033[97m',  # Blue
-        logging.INFO: '\033[97m',  # Blue
-        logging.WARNING: '\033[93m',  # Yellow
-        logging.ERROR: '\033[91m',  # Red
-        logging.CRITICAL: '\033[91m',  # Red
-    }
+    # indexed by level // 10, higher levels use the CRITICAL color
+    COLORS = (
+        '',  # NOTSET
+        '\033[97m',  # DEBUG: Blue
+        '\033[97m',  # INFO: Blue
+        '\033[93m',  # WARNING: Yellow
+        '\033[91m',  # ERROR: Red
+        '\033[91m',  # CRITICAL: Red
+    )
 
     RESET_SEQ = '\033[0m'
 
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        # same output as the default format, but without parsing the time format for every record
+        t = self.converter(record.created)
+        return (f'{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d},'
+                f'{int(record.msecs):03d}')
+
     def format(self, record):
-        log_color = self.COLORS.get(record.levelno)
-        logger_name = record.name
-        logger_datetime = self.formatTime(record, self.datefmt)
-        log_level = record.levelname
-        log_message = record.getMessage()
-        log_format = '{}{} - [{}] - {} - {}{}'.format(log_color, logger_datetime, logger_name, log_level, log_message,
-                                                  self.RESET_SEQ)
-        return log_format
+        return (f'{self.COLORS[min(record.levelno // 10, 5)]}{self.formatTime(record, self.datefmt)} - '
+                f'[{record.name}] - {record.levelname} - {record.getMessage()}{self.RESET_SEQ}')
 
 
 class OpenRailsLogFormatter(DefaultFormatter):
-    COLORS = {
-        logging.DEBUG: '\033[94m',  # Blue
-        logging.INFO: '\033[94m',  # Blue
-        logging.WARNING: '\033[93m',  # Yellow
-        logging.ERROR: '\033[91m',  # Red
-        logging.CRITICAL: '\033[91m',  # Red
-    }
+    COLORS = (
+        '',  # NOTSET
+        '\033[94m',  # DEBUG: Blue
+        '\033[94m',  # INFO: Blue
+        '\033[93m',  # WARNING: Yellow
+        '\033[91m',  # ERROR: Red
+        '\033[91m',  # CRITICAL: Red
+    )
 
     RESET_SEQ = '\033[0m'
 
+
+class _BufferedHandler(MemoryHandler):
+    """
+    Memory handler that additionally flushes when the oldest buffered record is older than a fixed interval,
+    so low-volume output does not get stuck in the buffer. Its listener checks the age while no records arrive.
+    """
+
+    def __init__(self, capacity, flush_interval, flushLevel=logging.ERROR, target=None):
+        super().__init__(capacity, flushLevel=flushLevel, target=target)
+        self.flush_interval = flush_interval
+        self._first_buffered = None
+
+    def emit(self, record):
+        if self._first_buffered is None:
+            self._first_buffered = time.monotonic()
+        super().emit(record)
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or self.is_due()
+
+    def is_due(self):
+        """
+        :return: `True` if the oldest buffered record has been buffered for the flush interval
+        """
+        first = self._first_buffered
+        return first is not None and time.monotonic() - first >= self.flush_interval
+
+    def flush(self):
+        super().flush()
+        self._first_buffered = None
+
+
+class _FlushingQueueListener(QueueListener):
+    """
+    Queue listener that flushes its due buffered handlers while it is waiting for records
+    """
+
+    def __init__(self, queue, *handlers, check_interval, **kwargs):
+        super().__init__(queue, *handlers, **kwargs)
+        self.check_interval = check_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.check_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    if handler.is_due():
+                        handler.flush()
+
+
+LOG_BUFFER_CAPACITY = 512
+LOG_FLUSH_INTERVAL_S = 30.0
+LOG_FLUSH_CHECK_S = 1.0
+
+_listeners = []
+
 SERVER_CONNECT_LOG = "Server Connector"
 OPENRAILS_LOGGER = "OpenRails Application"
 
-def get_server_connector_log():
-    log = logging.getLogger(SERVER_CONNECT_LOG)
-    handler = logging.StreamHandler(stream=sys.stdout)
-    handler.setFormatter(DefaultFormatter())
-    # # avoid adding multiple handlers:
-    # if not log.hasHandlers():
-    log.addHandler(handler)
-    log.propagate = False
+
+def _configure_log(name: str, formatter: logging.Formatter) -> logging.Logger:
+    log = logging.getLogger(name)
+    # avoid adding multiple handlers; hasHandlers() would also report the root handlers, so check the logger itself
+    if not log.handlers:
+        stream_handler = logging.StreamHandler(stream=sys.stdout)
+        stream_handler.setFormatter(formatter)
+        # batch the stream writes; errors and anything older than the flush interval are written out immediately
+        handler = _BufferedHandler(LOG_BUFFER_CAPACITY, LOG_FLUSH_INTERVAL_S, target=stream_handler)
+        atexit.register(handler.close)
+        # the stream is written by a background listener thread, so logging does not block the simulation loop
+        log_queue = queue.SimpleQueue()
+        listener = _FlushingQueueListener(log_queue, handler, check_interval=LOG_FLUSH_CHECK_S,
+                                          respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        atexit.register(_stop_listener, listener)
+        log.addHandler(QueueHandler(log_queue))
+        log.propagate = False
     return log
 
+
+def _stop_listener(listener: QueueListener):
+    # stop() fails if the listener is not running
+    if listener._thread is not None:
+        listener.stop()
+
+
+def get_server_connector_log():
+    return _configure_log(SERVER_CONNECT_LOG, DefaultFormatter())
+
+
 def get_openrails_log():
-    log = logging.getLogger(OPENRAILS_LOGGER)
-    handler = logging.StreamHandler(stream=sys.stdout)
-    handler.setFormatter(OpenRailsLogFormatter())
-    # # avoid adding multiple handlers:
-    # if not log.hasHandlers():
-    log.addHandler(handler)
-    log.propagate = False
-    return log
+    return _configure_log(OPENRAILS_LOGGER, OpenRailsLogFormatter())
+
+
+def flush_logs():
+    """
+    Write out all queued and buffered records of the server and OpenRails loggers
+    """
+    for listener in _listeners:
+        running = listener._thread is not None
+        if running:
+            # stopping processes all records queued so far
+            listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+        if running:
+            listener.start()
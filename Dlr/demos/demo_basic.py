@@ -1,16 +1,29 @@
+from __future__ import annotations
+
 import datetime
 import logging
 import os
-from typing import Tuple, Callable
+from functools import lru_cache
+from typing import TYPE_CHECKING, Tuple, Callable
 import sys
-import simpy
 from config.constants import OR_CONTENT_BASE
-from simulation_client.openrails_interface.environment import Season, Environment, Weather
-from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
-from simulation_client.model.train import Train
-from routecreation.railgraphs import Graph, Node, find_shortest_path
-from routecreation.geometry import Vector, Pose
-from routecreation.openrails_data import ORWriter
+from config.log_config import flush_logs
+
+if TYPE_CHECKING:
+    import simpy
+    from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
+    from simulation_client.model.train import Train
+
+# enable simple logging with different levels (NOTSET, DEBUG, INFO, WARN/WARNING, FATAL/ERROR)
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO,
+                        stream=sys.stdout,
+                        format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# number of simulation steps between two progress messages
+LOG_INTERVAL_STEPS = 10
 
 
 def create_route(output_path: str) -> None:
@@ -20,26 +33,51 @@ def create_route(output_path: str) -> None:
     :param output_path: The path to the output directory of the new route
     :returns: Nothing
     """
+    # route creation imports are deferred until a route is actually created
+    from routecreation.railgraphs import Graph, Node, find_shortest_path
+    from routecreation.geometry import Vector, Pose
+    from routecreation.openrails_data import ORWriter
+
     # initialize a graph
     graph = Graph()
     # simple straight route
     start = Node(pose=Pose(Vector(x=1000.0, y=0.0)), graph=graph)
     end = start.add_edge(length=1200.0)
 
+    # the reverse path runs over the same edges, so it is derived from the forward path instead of searching again
+    main_path = find_shortest_path(start, end)
+    reverse_path = main_path.copy()
+    reverse_path.reverse()
+
+    # define custom paths through the graph which can be used to initialize a train
+    # (filename, name, start name, end name, points)
+    paths = [('0', 'main', 'start', 'end', main_path),
+             ('1', 'reverse', 'end', 'start', reverse_path)]
+
     # initialize the Open Rails writer
     writer = ORWriter(directory=output_path, graph=graph)
+    # skip writing if the route files have already been written for the same graph and paths
+    route_hash = writer.route_hash(paths)
+    if writer.is_up_to_date(route_hash):
+        return
     writer.write_all()
-    # define custom paths through the graph which can be used to initialize a train
-    writer.write_path_file(filename='0',
-                           name='main',
-                           start_name='start',
-                           end_name='end',
-                           points=find_shortest_path(start, end))
-    writer.write_path_file(filename='1',
-                           name='reverse',
-                           start_name='end',
-                           end_name='start',
-                           points=find_shortest_path(end, start))
+    writer.write_path_files(paths)
+    writer.save_route_hash(route_hash)
+
+
+@lru_cache(maxsize=1)
+def _content_paths() -> Tuple[str, str]:
+    """
+    Resolve the demo route and consist paths. The OpenRails content base does not change during the lifetime of the
+    process, so the paths are only computed once.
+
+    :returns: Tuple of the route directory and the consist file path
+    """
+    # for setting OR_CONTENT_BASE-environment see the documentation
+    content_base_path = os.getenv(OR_CONTENT_BASE)
+    route = os.path.join(content_base_path, r"Demo Model 1\ROUTES\demo_route")
+    consist = os.path.join(content_base_path, r"Demo Model 1\TRAINS\CONSISTS\MT_MT_Class 27 102 & 6 mk2 PP.CON")
+    return route, consist
 
 
 def setup() -> Tuple[Train, OpenRailsServer, simpy.Environment]:
@@ -47,15 +85,14 @@ def setup() -> Tuple[Train, OpenRailsServer, simpy.Environment]:
     This function is used to set up the simulation environment.
     :returns: Tuple of the ego train instance, an OpenRailsServer instance and a simpy simulation environment
     """
-    # enable simple logging with different levels (NOTSET, DEBUG, INFO, WARN/WARNING, FATAL/ERROR)
-    logging.basicConfig(level=logging.INFO,
-                        stream=sys.stdout,
-                        format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s')
+    # simulation imports are deferred until the simulation is actually set up
+    import simpy
+    from simulation_client.openrails_interface.environment import Season, Environment, Weather
+    from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
+    from simulation_client.model.train import Train
 
     # initialize assets and open rails environment
-    # for setting OR_CONTENT_BASE-environment see the documentation
-    content_base_path = os.getenv(OR_CONTENT_BASE)
-    route = os.path.join(content_base_path, r"Demo Model 1\ROUTES\demo_route")
+    route, consist = _content_paths()
 
     # initialize the route
     create_route(output_path=route)
@@ -70,9 +107,6 @@ def setup() -> Tuple[Train, OpenRailsServer, simpy.Environment]:
                              step_size_ms=250,
                              show_server_logs=False)
 
-    # define the consist file path in order to load the ego train model
-    consist = os.path.join(content_base_path, r"Demo Model 1\TRAINS\CONSISTS\MT_MT_Class 27 102 & 6 mk2 PP.CON")
-
     # initialize ego train
     ego_train = Train(server=server,
                       consist=consist,
@@ -110,28 +144,43 @@ def run(train: Train,
                                                                                   server,
                                                                                   simulation_environment,
                                                                                   **kwargs)))
+    # write out log records that are still buffered
+    flush_logs()
 
 
-def stop(train: Train,
-         server: OpenRailsServer,
-         simulation_environment: simpy.Environment,
-         max_distance: int = 300):
+def make_stop(max_distance: float = 300) -> Callable:
     """
-    Custom stop function which terminates after the ego train passes a certain distance
+    Create a custom stop function which terminates after the ego train passes a certain distance. The threshold is
+    bound when the stop function is created instead of being passed through `run` as keyword argument.
 
-    :param train: Ego train instance which can be influenced by the developer.
-    :param server: OpenRailsServer instance which hosts the simulation and the python client communicates to.
-    :param simulation_environment: Simpy simulation environment for setting up the simulation processes
     :param max_distance: Train distance threshold after which the simulation is being stopped.
+    :returns: the stop function
     """
-    while True:
-        print(f"ego train distance travelled: {train.distance_travelled}")
-        # if the train crosses the distance threshold, the entire simulation stops
-        if train.distance_travelled > max_distance:
-            yield simulation_environment.event().succeed()
-            break
-        else:
-            yield simulation_environment.timeout(server.step_size_ms)
+    def stop(train: Train,
+             server: OpenRailsServer,
+             simulation_environment: simpy.Environment):
+        """
+        :param train: Ego train instance which can be influenced by the developer.
+        :param server: OpenRailsServer instance which hosts the simulation and the python client communicates to.
+        :param simulation_environment: Simpy simulation environment for setting up the simulation processes
+        """
+        # the step size and the timeout factory do not change during the run
+        timeout = simulation_environment.timeout
+        step_size_ms = server.step_size_ms
+        steps = 0
+        while True:
+            # read the train state once, so the log message and the check refer to the same step
+            distance_travelled = train.distance_travelled
+            if steps % LOG_INTERVAL_STEPS == 0:
+                logger.info("ego train distance travelled: %s", distance_travelled)
+            steps += 1
+            # if the train crosses the distance threshold, the entire simulation stops
+            if distance_travelled > max_distance:
+                return
+            else:
+                yield timeout(step_size_ms)
+
+    return stop
 
 
 def main():
@@ -139,8 +188,7 @@ def main():
     run(train=ego_train,
         server=server,
         simulation_environment=simulation_environment,
-        stop_function=stop,
-        max_distance=1000)
+        stop_function=make_stop(max_distance=1000))
 
 
 if __name__ == "__main__":
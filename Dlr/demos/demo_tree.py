@@ -1,19 +1,31 @@
+from __future__ import annotations
+
 import datetime
+import itertools
 import logging
 import os
-from typing import Tuple, Callable, List
+from functools import lru_cache
+from typing import TYPE_CHECKING, Tuple, Callable, List
 import sys
-import simpy
 import math
-from numpy import arange
 from config.constants import OR_CONTENT_BASE
-from simulation_client.openrails_interface.environment import Season, Environment, Weather
-from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
-from simulation_client.model.train import Train
-from routecreation.railgraphs import Graph, Node, Path, SceneryObject
-from routecreation.geometry import Vector, Pose
-from routecreation.openrails_data import ORWriter
-from simulation_client.model.dynamic_objects import DynamicObject
+from config.log_config import flush_logs
+
+if TYPE_CHECKING:
+    import simpy
+    from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
+    from simulation_client.model.train import Train
+    from simulation_client.model.dynamic_objects import DynamicObject
+    from routecreation.railgraphs import Graph, SceneryObject
+
+# enable simple logging with different levels (NOTSET, DEBUG, INFO, WARN/WARNING, FATAL/ERROR)
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.WARN,
+                        stream=sys.stdout,
+                        format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s')
+
+# falling tree trajectory (roll angles per simulation step)
+_FALL_TRAJECTORY = tuple(2.0 * math.sin(0.01 * i) for i in range(math.ceil(math.pi / 0.01)))
 
 
 def set_scene(output_path: str, create_route: bool = False) -> Tuple[Graph, List[SceneryObject]]:
@@ -25,6 +37,11 @@ def set_scene(output_path: str, create_route: bool = False) -> Tuple[Graph, List
                          times)
     :returns: the Graph object as well as a list of static scenery objects (in this demo: one tree)
     """
+    # route creation imports are deferred until a route is actually created
+    from routecreation.railgraphs import Graph, Node, Path, SceneryObject
+    from routecreation.geometry import Vector, Pose
+    from routecreation.openrails_data import ORWriter
+
     graph = Graph()
     start = Node(pose=Pose(Vector(x=-1000.0, y=0.0)), graph=graph)
     end = start.add_edge(length=2000.0)
@@ -35,37 +52,52 @@ def set_scene(output_path: str, create_route: bool = False) -> Tuple[Graph, List
                          animated=True)
 
     if create_route:
+        # (filename, name, start name, end name, points)
+        paths = [('0', 'main', 'start', 'end', Path([end.other_end()])),
+                 ('1', 'revers', 'end', 'start', Path([end]))]
+
         writer = ORWriter(directory=output_path, graph=graph)
+        # skip writing if the route files have already been written for the same graph and paths
+        route_hash = writer.route_hash(paths)
+        if writer.is_up_to_date(route_hash):
+            return graph, [tree]
         writer.write_all()
-        writer.write_path_file(filename='0',
-                               name='main',
-                               start_name='start',
-                               end_name='end',
-                               points=Path([end.other_end()]))
-        writer.write_path_file(filename='1',
-                               name='revers',
-                               start_name='end',
-                               end_name='start',
-                               points=Path([end]))
+        writer.write_path_files(paths)
+        writer.save_route_hash(route_hash)
 
     return graph, [tree]
 
 
+@lru_cache(maxsize=1)
+def _content_paths() -> Tuple[str, str]:
+    """
+    Resolve the demo route and consist paths. The OpenRails content base does not change during the lifetime of the
+    process, so the paths are only computed once.
+
+    :returns: Tuple of the route directory and the consist file path
+    """
+    # for setting OR_CONTENT_BASE-environment see the documentation
+    content_base_path = os.getenv(OR_CONTENT_BASE)
+    route = os.path.join(content_base_path, r"Demo Model 1\ROUTES\demo_route")
+    consist = os.path.join(content_base_path, r"Demo Model 1\TRAINS\CONSISTS\MT_MT_Class 27 102 & 6 mk2 PP.CON")
+    return route, consist
+
+
 def setup() -> Tuple[Train, OpenRailsServer, simpy.Environment, List[DynamicObject]]:
     """
     This function is used to set up the simulation environment.
     :returns: Tuple including the ego train instance, an OpenRailsServer instance, a simpy simulation environment and
               a list of dynamic objects (in this demo: one tree)
     """
-    # enable simple logging with different levels (NOTSET, DEBUG, INFO, WARN/WARNING, FATAL/ERROR)
-    logging.basicConfig(level=logging.WARN,
-                        stream=sys.stdout,
-                        format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s')
+    # simulation imports are deferred until the simulation is actually set up
+    import simpy
+    from simulation_client.openrails_interface.environment import Season, Environment, Weather
+    from simulation_client.openrails_interface.open_rails_server_interface import OpenRailsServer
+    from simulation_client.model.train import Train
+    from simulation_client.model.dynamic_objects import DynamicObject
 
     # initialize assets and open rails environment
-    # for setting OR_CONTENT_BASE-environment see the documentation
-    content_base_path = os.getenv(OR_CONTENT_BASE)
-    route = os.path.join(content_base_path, r"Demo Model 1\ROUTES\demo_route")
+    route, consist = _content_paths()
 
     # initialize the scene (route + tree)
     route_graph, scene_objects = set_scene(output_path=route,
@@ -84,9 +116,6 @@ def setup() -> Tuple[Train, OpenRailsServer, simpy.Environment, List[DynamicObje
     # convert scene object (tree) into dynamic object
     dynamic_tree = DynamicObject(server=server, obj=scene_objects[0])
 
-    # define the consist file path in order to load the train model
-    consist = os.path.join(content_base_path, r"Demo Model 1\TRAINS\CONSISTS\MT_MT_Class 27 102 & 6 mk2 PP.CON")
-
     # initialize ego train
     ego_train = Train(server=server,
                       consist=consist,
@@ -125,36 +154,44 @@ def run(train: Train,
                                                                                   server,
                                                                                   simulation_environment,
                                                                                   **kwargs)))
+    # write out log records that are still buffered
+    flush_logs()
 
 
 def stop(train: Train,
          server: OpenRailsServer,
          simulation_environment: simpy.Environment,
-         tree: DynamicObject):
+         trees: List[DynamicObject]):
     """
-    Custom stop function which defines the logic for the tree falling onto the track and stopping the train accordingly.
-    This method terminates after the ego train travelling a fixed distance.
+    Custom stop function which defines the logic for the trees falling onto the track and stopping the train
+    accordingly. This method terminates after the ego train travelling a fixed distance.
 
     :param train: Ego train instance which can be influenced by the developer.
     :param server: OpenRailsServer instance which hosts the simulation and the python client communicates to.
     :param simulation_environment: Simpy simulation environment for setting up the simulation processes
-    :param tree: dynamic object which falls onto the track
+    :param trees: dynamic objects which fall onto the track
     """
-    # falling tree trajectory
-    falling_tree_trajectory = [2.0 * math.sin(x) for x in arange(0, math.pi, 0.01)]
-    i: int = 0
+    # the step size and the timeout factory do not change during the run
+    timeout = simulation_environment.timeout
+    step_size_ms = server.step_size_ms
+    # all trees follow the same trajectory, so one frame per step is shared between them
+    roll_iter = itertools.cycle(_FALL_TRAJECTORY)
     while True:
-        if tree.roll <= 1.5 and train.distance_travelled > 100:
-            tree.roll = falling_tree_trajectory[i]
-            i = (i + 1) % len(falling_tree_trajectory)
-        if train.distance_travelled > 200:
+        # read the train state once, so all checks refer to the same step
+        distance_travelled = train.distance_travelled
+        if distance_travelled > 100:
+            falling_trees = [tree for tree in trees if tree.roll <= 1.5]
+            if falling_trees:
+                roll = next(roll_iter)
+                for tree in falling_trees:
+                    tree.roll = roll
+        if distance_travelled > 200:
             if train.velocity_y < 0.0001:
-                yield simulation_environment.event().succeed()
-                break
+                return
             else:
                 train.set(train_brake=0.3)
             train.set_diesel(throttle=0.0)
-        yield simulation_environment.timeout(server.step_size_ms)
+        yield timeout(step_size_ms)
 
 
 def main():
@@ -163,7 +200,7 @@ def main():
         server=server,
         simulation_environment=simulation_environment,
         stop_function=stop,
-        tree=scene_objects[0])
+        trees=scene_objects)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+import heapq
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+    COMPILED = True
+except ImportError:  # numba is optional, without it the kernels run as plain Python functions
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+    COMPILED = False
+
+"""
+Numeric kernels for the geometry helpers, the graph algorithms and the OpenRails writer. They work on plain numbers
+and arrays instead of Vector and graph objects, so they can be compiled with numba if it is installed.
+"""
+
+_TWO_PI = 2.0 * math.pi
+_HALF_PI = 0.5 * math.pi
+
+
+@njit(cache=True)
+def _arc(px, py, tx, ty, pmx, pmy, d):
+    """
+    Radius and angle of the arc from point p with tangent t to the bi-arc mid point pm
+    """
+    # p -> pm and the arc normal in p, each computed once
+    wx = pmx - px
+    wy = pmy - py
+    nx = -ty
+    ny = tx
+    ww = wx * wx + wy * wy
+    nw = nx * wx + ny * wy
+    s = ww / (2 * nw)
+    cx = px + s * nx
+    cy = py + s * ny
+    r = abs(s)
+    # c -> p and c -> pm, atan2 does not need them normalized
+    opx = px - cx
+    opy = py - cy
+    omx = pmx - cx
+    omy = pmy - cy
+
+    # signed angle from op to om, a zero cross product counts as clockwise
+    cross = opx * omy - opy * omx
+    theta = math.atan2(cross, opx * omx + opy * omy)
+    if cross == 0.0:
+        theta = -abs(theta)
+    if d <= 0:
+        theta -= math.copysign(_TWO_PI, theta)
+    return r, theta
+
+
+@njit(cache=True)
+def biarc(p1x, p1y, t1x, t1y, p2x, p2y, t2x, t2y):
+    """
+    bi-arc interpolation on scalar coordinates, see geometry.biarc_interpolation.
+    The case of parallel tangents perpendicular to p2 - p1 must be handled by the caller.
+
+    :return: tuple (r1, theta1, r2, theta2)
+    """
+    vx = p2x - p1x
+    vy = p2y - p1y
+    vt = vx * (t1x + t2x) + vy * (t1y + t2y)
+    vv = vx * vx + vy * vy
+    t1t2 = t1x * t2x + t1y * t2y
+    denominator = 2 * (1 - t1t2)
+    if denominator == 0.0:
+        d = 0.5 * vv / vt
+    else:
+        d = (-vt + math.sqrt(vt * vt + denominator * vv)) / denominator
+
+    pmx = 0.5 * (p1x + p2x + d * (t1x - t2x))
+    pmy = 0.5 * (p1y + p2y + d * (t1y - t2y))
+
+    r1, theta1 = _arc(p1x, p1y, t1x, t1y, pmx, pmy, d)
+    r2, theta2 = _arc(p2x, p2y, t2x, t2y, pmx, pmy, d)
+    return r1, theta1, r2, theta2
+
+
+@njit(cache=True)
+def _part1by1(n):
+    """
+    Spread the lower 16 bits of n to the even bit positions of the result (Morton code)
+    """
+    n = (n | (n << 8)) & 0x00FF00FF
+    n = (n | (n << 4)) & 0x0F0F0F0F
+    n = (n | (n << 2)) & 0x33333333
+    n = (n | (n << 1)) & 0x55555555
+    return n
+
+
+@njit(cache=True)
+def tile_index(tile_x, tile_z):
+    """
+    Index of a tile as used in the names of the terrain files (*.t, *_y.raw)
+
+    :param tile_x: tile X
+    :param tile_z: tile Z
+    :return: the tile index
+    """
+    x = tile_x + (1 << 14)
+    z = tile_z + (1 << 14)
+    x = ~(x ^ z)
+    z = ~z
+    # interleave the lower 15 bits of x and z, x in the even bits
+    return (_part1by1(x & 0x7FFF) | (_part1by1(z & 0x7FFF) << 1)) << 2
+
+
+@njit(cache=True)
+def segment_travel(sx, sy, sdir, scos, ssin, radius, s):
+    """
+    Pose reached after travelling along an edge segment, see railgraphs.EdgeSegment.travel
+
+    :param sx: x of the segment start
+    :param sy: y of the segment start
+    :param sdir: direction of the segment start
+    :param scos: cosine of sdir
+    :param ssin: sine of sdir
+    :param radius: segment radius, 0 for straight segments
+    :param s: way to travel
+    :return: tuple (x, y, direction)
+    """
+    if radius == 0.0:
+        return sx + scos * s, sy + ssin * s, sdir
+    cx = sx + math.cos(sdir - _HALF_PI) * radius
+    cy = sy + math.sin(sdir - _HALF_PI) * radius
+    angle = s / radius
+    beta = sdir + _HALF_PI - angle
+    return cx + math.cos(beta) * radius, cy + math.sin(beta) * radius, sdir - angle
+
+
+@njit(cache=True)
+def segment_to_global(sx, sy, sdir, scos, ssin, radius, x, y):
+    """
+    Global position of the local coordinates (x, y) of an edge segment, see railgraphs.EdgeSegment.to_global
+
+    :return: tuple (x, y, direction), direction is the track direction at x in the range [0, 2pi)
+    """
+    qx, qy, qdir = segment_travel(sx, sy, sdir, scos, ssin, radius, x)
+    qdir = qdir % _TWO_PI
+    return qx - math.sin(qdir) * y, qy + math.cos(qdir) * y, qdir
+
+
+@njit(cache=True)
+def arc_to_local(sx, sy, sdir, radius, px, py):
+    """
+    Arc coordinates of a point relative to a curved edge segment, see railgraphs.EdgeSegment.to_local
+
+    :return: tuple (s, y, angle) of the way along the arc, the lateral offset and the angle from the segment start
+    """
+    cx = sx + math.cos(sdir - _HALF_PI) * radius
+    cy = sy + math.sin(sdir - _HALF_PI) * radius
+    dx = px - cx
+    dy = py - cy
+    d = math.hypot(dx, dy)
+    if radius > 0:
+        y = d - radius
+        angle = (sdir + 0.5 * math.pi - math.atan2(dy, dx)) % (2 * math.pi)
+    else:
+        y = -radius - d
+        angle = (math.atan2(dy, dx) + 0.5 * math.pi - sdir) % (2 * math.pi)
+    return angle * abs(radius), y, angle
+
+
+@njit(cache=True)
+def shortest_path(indptr, successors, lengths, reached_nodes, starts, goal):
+    """
+    Dijkstra's algorithm on the ends of a graph in compressed sparse row form, see railgraphs.find_shortest_path.
+    Ties are resolved in the order the ends are pushed, as in the Python implementation.
+
+    :param indptr: the ends that can follow end i are successors[indptr[i]:indptr[i + 1]]
+    :param successors: indices of the following ends
+    :param lengths: length of the edge of each end
+    :param reached_nodes: index of the node reached when driving along each end, -1 if there is none
+    :param starts: indices of the ends to start with
+    :param goal: index of the destination node
+    :return: tuple of the index of the last end of the path (-1 if there are no start ends) and the predecessor
+             index of each end (-1 for none)
+    """
+    distances = np.full(len(lengths), np.inf)
+    predecessors = np.full(len(lengths), -1, dtype=np.int64)
+    heap = [(0.0, 0, 0)]
+    heap.pop()
+    cnt = 0
+    for end in starts:
+        d = lengths[end]
+        distances[end] = d
+        heapq.heappush(heap, (d, cnt, end))
+        cnt += 1
+    current = -1
+    while heap:
+        s, _, current = heapq.heappop(heap)
+        if s > distances[current]:
+            continue
+        if reached_nodes[current] == goal:
+            break
+        for k in range(indptr[current], indptr[current + 1]):
+            end = successors[k]
+            d = s + lengths[end]
+            if d < distances[end]:
+                distances[end] = d
+                predecessors[end] = current
+                heapq.heappush(heap, (d, cnt, end))
+                cnt += 1
+    return current, predecessors
@@ -1,23 +1,35 @@
 import math
-from typing import Union
+from typing import Tuple, Union
+
+import numpy as np
+
+from routecreation import _geom_kernels
 
 """
 Helpers for geometry in the 2D plane
 """
 
+_PI = math.pi
+_TWO_PI = 2.0 * math.pi
+_HALF_PI = 0.5 * math.pi
+
 
 class Vector:
     """
-    A 2D vector
+    A 2D vector. Vectors are immutable values, all operations return new vectors
     """
-    def __init__(self, x=0.0, y=0.0):
+    __slots__ = ('x', 'y')
+    x: float
+    y: float
+
+    def __init__(self, x: float = 0.0, y: float = 0.0):
         self.x = x
         self.y = y
 
-    def __hash__(self):
-        return hash(self.x + self.y)
+    def __hash__(self) -> int:
+        return hash((self.x, self.y))
 
-    def __eq__(self, other):
+    def __eq__(self, other: object) -> bool:
         return isinstance(other, Vector) and self.x == other.x and self.y == other.y
 
     def __str__(self):
@@ -26,13 +38,13 @@ class Vector:
     def __repr__(self):
         return f'({self.x}, {self.y})'
 
-    def __sub__(self, other):
+    def __sub__(self, other: 'Vector') -> 'Vector':
         return Vector(self.x - other.x, self.y - other.y)
 
-    def __add__(self, other):
+    def __add__(self, other: 'Vector') -> 'Vector':
         return Vector(self.x + other.x, self.y + other.y)
 
-    def __mul__(self, other):
+    def __mul__(self, other: Union['Vector', float]) -> Union['Vector', float]:
         """
         Dot product or scale
         :param other:
@@ -43,7 +55,31 @@ class Vector:
         else:
             return Vector(self.x * other, self.y * other)
 
-    def __rmul__(self, other):
+    def dot(self, other: 'Vector') -> float:
+        """
+        Dot product, without the type check of the * operator
+        :param other: other vector
+        :return: the dot product
+        """
+        return self.x * other.x + self.y * other.y
+
+    def scale(self, factor: float) -> 'Vector':
+        """
+        Scaled vector, without the type check of the * operator
+        :param factor: scale factor
+        :return: the scaled vector
+        """
+        return Vector(self.x * factor, self.y * factor)
+
+    def cross(self, other: 'Vector') -> float:
+        """
+        Up-vector of vector cross product, same as the @ operator
+        :param other: other vector
+        :return: Z component of cross product
+        """
+        return self.x * other.y - self.y * other.x
+
+    def __rmul__(self, other: Union['Vector', float]) -> Union['Vector', float]:
         """
         Dot product or scale
         :param other:
@@ -51,7 +87,7 @@ class Vector:
         """
         return self.__mul__(other)
 
-    def __truediv__(self, other):
+    def __truediv__(self, other: float) -> 'Vector':
         """
         Inverse scale
 
@@ -60,39 +96,46 @@ class Vector:
         """
         return Vector(self.x / other, self.y / other)
 
-    def __abs__(self):
+    def __abs__(self) -> float:
         """
         Vector length
         :return:
         """
-        return math.sqrt(self.x**2 + self.y**2)
+        return math.hypot(self.x, self.y)
 
-    def alpha(self):
+    def alpha(self) -> float:
         """
         Direction of the vector, counter-clockwise from X axis in radians
         :return:
         """
         return math.atan2(self.y, self.x)
 
-    def ortho(self):
+    def ortho(self) -> 'Vector':
         """
         Orthogonal vector, i.e. (-Y, X)
         :return: the orthogonal vector
         """
         return Vector(-self.y, self.x)
 
-    def norm(self):
+    def norm(self) -> 'Vector':
         """
         Normalized vector, i.e. same direction but length 1.0
         :return: the normalized vector
         """
-        length = abs(self)
-        return Vector(self.x / length, self.y / length)
+        inv_length = 1.0 / math.sqrt(self.x * self.x + self.y * self.y)
+        return Vector(self.x * inv_length, self.y * inv_length)
+
+    def norm_sq(self) -> float:
+        """
+        Squared vector length, cheaper than abs() if only lengths are compared
+        :return:
+        """
+        return self.x * self.x + self.y * self.y
 
-    def __neg__(self):
+    def __neg__(self) -> 'Vector':
         return Vector(-self.x, -self.y)
 
-    def __matmul__(self, other):
+    def __matmul__(self, other: 'Vector') -> float:
         """
         Up-vector of vector cross product
         :param other: other vector
@@ -100,44 +143,135 @@ class Vector:
         """
         return self.x * other.y - self.y * other.x
 
-    def copy(self):
-        return Vector(self.x, self.y)
+    def copy(self) -> 'Vector':
+        # immutable, so the vector itself can be shared
+        return self
+
+
+class VectorArray:
+    """
+    Many 2D vectors, stored as separate numpy arrays of X and Y coordinates
+    """
+    __slots__ = ('xs', 'ys')
+
+    def __init__(self, xs, ys):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+
+    @staticmethod
+    def from_vectors(vectors):
+        """
+        Create from a sequence of vectors
+        :param vectors: iterable of Vector
+        :return: the vector array
+        """
+        vectors = list(vectors)
+        return VectorArray([v.x for v in vectors], [v.y for v in vectors])
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, i):
+        return Vector(float(self.xs[i]), float(self.ys[i]))
+
+    def __iter__(self):
+        return (Vector(x, y) for x, y in zip(self.xs.tolist(), self.ys.tolist()))
 
+    def dot(self, other):
+        """
+        Element-wise dot product
+        :param other: vector array of same length
+        :return: array of dot products
+        """
+        return self.xs * other.xs + self.ys * other.ys
 
+    def cross(self, other):
+        """
+        Element-wise Z component of the cross product
+        :param other: vector array of same length
+        :return: array of cross products
+        """
+        return self.xs * other.ys - self.ys * other.xs
 
+    def length(self):
+        """
+        Vector lengths
+        :return: array of lengths
+        """
+        return np.hypot(self.xs, self.ys)
 
-def polar(alpha, length=1.0):
+    def ortho(self):
+        """
+        Orthogonal vectors, i.e. (-Y, X)
+        :return: the orthogonal vector array
+        """
+        return VectorArray(-self.ys, self.xs.copy())
+
+
+
+
+def polar(alpha: float, length: float = 1.0) -> Vector:
     """
     Create a vector with certain direction and length
     :param alpha: direction
     :param length: length
     :return:
     """
-    return Vector(math.cos(alpha) * length, math.sin(alpha) * length)
+    x, y = _polar_xy(alpha)
+    return Vector(x * length, y * length)
+
+
+def _polar_xy(alpha: float) -> Tuple[float, float]:
+    """
+    Unit vector with a certain direction as plain (x, y) tuple, without allocating a Vector
+    :param alpha: direction
+    :return: tuple (cos(alpha), sin(alpha))
+    """
+    return math.cos(alpha), math.sin(alpha)
 
 
 class Pose:
     """
     A pose combines a position with a direction
     """
-    def __init__(self, pos: Vector, direction=0.0):
+    __slots__ = ('pos', 'direction', '_cos', '_sin')
+    pos: Vector
+    direction: float
+    _cos: float
+    _sin: float
+
+    def __init__(self, pos: Vector, direction: float = 0.0):
         self.pos = pos
-        self.direction = direction % (2*math.pi)
+        self.direction = direction % _TWO_PI  # immutable, the cached basis below depends on it
+        self._cos = math.cos(self.direction)
+        self._sin = math.sin(self.direction)
 
-    def reverse(self):
+    def reverse(self) -> 'Pose':
         """
         Same position, but reverse direction (i.e., turn by 180°)
         :return: the reverse position
         """
-        return Pose(self.pos, self.direction + math.pi)
+        return Pose(self.pos, self.direction + _PI)
+
+    @staticmethod
+    def _new(pos: Vector, direction: float, cos: float, sin: float) -> 'Pose':
+        """
+        Create a pose from an already normalized direction and its cosine and sine, skipping __init__
+        """
+        pose = object.__new__(Pose)
+        pose.pos = pos
+        pose.direction = direction
+        pose._cos = cos
+        pose._sin = sin
+        return pose
 
-    def copy(self):
-        return Pose(self.pos.copy(), self.direction)
+    def copy(self) -> 'Pose':
+        return Pose._new(self.pos, self.direction, self._cos, self._sin)
 
-    def __copy__(self):
+    def __copy__(self) -> 'Pose':
         return self.copy()
 
-    def to_global(self, other: Union['Pose', Vector]):
+    def to_global(self, other: Union['Pose', Vector]) -> Union['Pose', Vector]:
         """
         Translate a point (or pose) from the local coordinate system spanned by this pose
         to the global coordinate system
@@ -146,15 +280,14 @@ class Pose:
             p = other.pos
         else:
             p = other
-        vx = polar(self.direction)
-        vy = vx.ortho()
-        p = self.pos + p.x * vx + p.y * vy
+        p = Vector(self.pos.x + p.x * self._cos - p.y * self._sin,
+                   self.pos.y + p.x * self._sin + p.y * self._cos)
         if isinstance(other, Pose):
             return Pose(p, self.direction + other.direction)
         else:
             return p
 
-    def to_local(self, other: Union['Pose', Vector]):
+    def to_local(self, other: Union['Pose', Vector]) -> Union['Pose', Vector]:
         """
         Translate a point (or pose) from the global coordinate system
         to the local coordinate system spanned by this pose
@@ -163,15 +296,42 @@ class Pose:
             p = other.pos
         else:
             p = other
-        vx = polar(self.direction)
-        vy = vx.ortho()
-        p = p - self.pos
-        p = Vector(p * vx, p * vy)
+        dx = p.x - self.pos.x
+        dy = p.y - self.pos.y
+        p = Vector(dx * self._cos + dy * self._sin, -dx * self._sin + dy * self._cos)
         if isinstance(other, Pose):
             return Pose(p, other.direction - self.direction)
         else:
             return p
 
+    def to_global_array(self, pts: np.ndarray) -> np.ndarray:
+        """
+        Translate many points at once from the local coordinate system spanned by this pose
+        to the global coordinate system
+
+        :param pts: (N, 2) array of local points
+        :return: (N, 2) array of global points
+        """
+        out = np.empty_like(pts, dtype=float)
+        out[:, 0] = self.pos.x + pts[:, 0] * self._cos - pts[:, 1] * self._sin
+        out[:, 1] = self.pos.y + pts[:, 0] * self._sin + pts[:, 1] * self._cos
+        return out
+
+    def to_local_array(self, pts: np.ndarray) -> np.ndarray:
+        """
+        Translate many points at once from the global coordinate system
+        to the local coordinate system spanned by this pose
+
+        :param pts: (N, 2) array of global points
+        :return: (N, 2) array of local points
+        """
+        dx = pts[:, 0] - self.pos.x
+        dy = pts[:, 1] - self.pos.y
+        out = np.empty_like(pts, dtype=float)
+        out[:, 0] = dx * self._cos + dy * self._sin
+        out[:, 1] = -dx * self._sin + dy * self._cos
+        return out
+
     def __str__(self):
         return f'({self.pos}, {self.direction})'
 
@@ -179,6 +339,13 @@ class Pose:
         return f'({self.pos}, {self.direction})'
 
 
+# Direction of poses and vectors by exact type, any other argument is taken as an angle
+_TO_ANGLE = {
+    Pose: lambda pose: pose.direction,
+    Vector: Vector.alpha,
+}
+
+
 def angle_between(alpha, beta):
     """
     Utility for the angle between two directions (angle difference beta - alpha), in the range [-pi, pi]
@@ -186,15 +353,20 @@ def angle_between(alpha, beta):
     :param beta:
     :return:
     """
-    if isinstance(alpha, Pose):
-        alpha = alpha.direction
-    elif isinstance(alpha, Vector):
-        alpha = alpha.alpha()
-    if isinstance(beta, Pose):
-        beta = beta.direction
-    elif isinstance(beta, Vector):
-        beta = beta.alpha()
-    return (beta - alpha + math.pi) % (2*math.pi) - math.pi
+    to_angle = _TO_ANGLE.get(type(alpha))
+    if to_angle:
+        alpha = to_angle(alpha)
+    to_angle = _TO_ANGLE.get(type(beta))
+    if to_angle:
+        beta = to_angle(beta)
+    return (beta - alpha + _PI) % _TWO_PI - _PI
+
+
+def _angle_diff(alpha: float, beta: float) -> float:
+    """
+    angle_between for plain float directions, without the conversion of poses and vectors
+    """
+    return (beta - alpha + _PI) % _TWO_PI - _PI
 
 
 def biarc_interpolation(p1: Vector, t1: Vector, p2: Vector, t2: Vector):
@@ -215,40 +387,68 @@ def biarc_interpolation(p1: Vector, t1: Vector, p2: Vector, t2: Vector):
     :return: tuple (r1, theta1, r2, theta2)
     """
     v = p2 - p1
-    t = t1 + t2
-    vt = v * t
-    denominator = 2 * (1 - t1 * t2)
-    if denominator == 0.0:
-        print('parallel')
-        if vt == 0.0:
-            c1 = p1 + 0.25*v
-            c2 = p1 + 0.75*v
-            theta1, theta2 = (math.pi, -math.pi) if v @ t2 < 0 else (-math.pi, math.pi)
-            return c1, theta1, c2, theta2
-        d = 0.5 * (v * v) / vt
-    else:
-        d = (-vt + math.sqrt(vt ** 2 + 2 * (1 - t1 * t2) * (v * v))) / denominator
-
-    pm = 0.5 * (p1 + p2 + d * (t1 - t2))
-
-    def calculate_arc(p, t_):
-        n = t_.ortho()
-        s = ((pm - p) * (pm - p)) / (2 * (n * (pm - p)))
-        c = p + s*n
-        r = abs(s)
-        op = (p - c) / r
-        om = (pm - c) / r
-
-        theta = math.acos(op * om)
-        if d <= 0:
-            theta -= 2*math.pi
-        if op @ om <= 0:
-            theta = -theta
-        return r, theta
-
-    r1, theta1 = calculate_arc(p1, t1)
-    r2, theta2 = calculate_arc(p2, t2)
-    return r1, theta1, r2, theta2
+    if t1.dot(t2) == 1.0 and v.dot(t1 + t2) == 0.0:
+        # two half circles with radius |p2 - p1| / 4
+        r = 0.25 * abs(v)
+        theta1, theta2 = (math.pi, -math.pi) if v.cross(t2) < 0 else (-math.pi, math.pi)
+        return r, theta1, r, theta2
+    return _geom_kernels.biarc(p1.x, p1.y, t1.x, t1.y, p2.x, p2.y, t2.x, t2.y)
 
 
+def biarc_interpolation_batch(p1: np.ndarray, t1: np.ndarray, p2: np.ndarray, t2: np.ndarray):
+    """
+    Vectorized bi-arc interpolation for many point pairs at once, see biarc_interpolation.
 
+    In the degenerate case of parallel tangents perpendicular to p2 - p1, the bi-arc consists of two half circles
+    with radius |p2 - p1| / 4.
+
+    :param p1: (N, 2) array of first (start) points
+    :param t1: (N, 2) array of tangents in first points (facing along the bi-arc)
+    :param p2: (N, 2) array of second (end) points
+    :param t2: (N, 2) array of tangents in second points (facing away from the bi-arc)
+    :return: tuple (r1, theta1, r2, theta2) of (N,) arrays
+    """
+    def dot(a, b):
+        return np.einsum('ij,ij->i', a, b)
+
+    def cross(a, b):
+        return a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+
+    v = p2 - p1
+    vt = dot(v, t1 + t2)
+    vv = dot(v, v)
+    denominator = 2 * (1 - dot(t1, t2))
+    parallel = denominator == 0.0
+    semicircles = parallel & (vt == 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = np.where(parallel,
+                     0.5 * vv / vt,
+                     (-vt + np.sqrt(vt ** 2 + denominator * vv)) / denominator)
+        pm = 0.5 * (p1 + p2 + d[:, np.newaxis] * (t1 - t2))
+
+        def calculate_arc(p, t_):
+            n = np.column_stack((-t_[:, 1], t_[:, 0]))
+            w = pm - p
+            s = dot(w, w) / (2 * dot(n, w))
+            c = p + s[:, np.newaxis] * n
+            r = np.abs(s)
+            op = p - c
+            om = pm - c
+
+            crs = cross(op, om)
+            theta = np.arctan2(crs, dot(op, om))
+            theta = np.where(crs == 0.0, -np.abs(theta), theta)
+            theta = np.where(d <= 0, theta - np.copysign(_TWO_PI, theta), theta)
+            return r, theta
+
+        r1, theta1 = calculate_arc(p1, t1)
+        r2, theta2 = calculate_arc(p2, t2)
+
+    if np.any(semicircles):
+        r = 0.25 * np.sqrt(vv[semicircles])
+        theta = np.where(cross(v[semicircles], t2[semicircles]) < 0, math.pi, -math.pi)
+        r1[semicircles] = r
+        theta1[semicircles] = theta
+        r2[semicircles] = r
+        theta2[semicircles] = -theta
+    return r1, theta1, r2, theta2
@@ -1,15 +1,24 @@
 import contextlib
+import hashlib
 import importlib.resources
+import io
 import logging
 import math
 import os.path
 import shutil
-from typing import Tuple, Dict, Any, List
+from collections import Counter
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Tuple, Dict, Any, List, Iterable, Optional
 
+import numpy as np
+
+from . import _geom_kernels
 from .geometry import Vector, Pose, angle_between
 from .railgraphs import Graph, EdgeSegment, Node, Edge, End, SceneryObject, SIGNAL_TYPE, Path
 import routecreation.railgraphs as rg
 
+logger = logging.getLogger(__name__)
+
 UNDEFINED = 4294967295
 
 GROUND_LEVEL = 1.0
@@ -20,6 +29,8 @@ DEFAULT_START_TILE = (-5354, 14849)
 
 TILE_SIZE = 2048.0
 
+_INV_TILE_SIZE = 1.0 / TILE_SIZE
+
 OR_TILE = 'or_tile'
 
 OR_SECTION_INDEX = 'or_section_index'
@@ -30,22 +41,49 @@ OR_TDB_INDEX = 'or_tdb_index'
 
 OR_W_FILE_INDEX = 'or_w_file_index'
 
+ROUTE_HASH_FILE = '.route.hash'
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+# rotation offsets of the QDirection quaternion for shapes facing along the different axes
+_FACING_OFFSETS = {'x': 0.0, 'y': 0.25 * math.pi, '-x': 0.5 * math.pi, '-y': 0.75 * math.pi}
+
 '''
 Classes for writing OpenRails files
 '''
 
+# indentation strings for the usual nesting depths of STF files
+_TABS = tuple('\t' * i for i in range(16))
+
+
+def _write_stf_file(path, content: str):
+    if os.linesep != '\n':
+        content = content.replace('\n', os.linesep)
+    with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(content.encode('UTF-16'))
+
 
 class STFOutput:
-    def __init__(self, f, signature_char):
+    def __init__(self, f, signature_char, executor: Executor = None):
+        """
+
+        :param f: path of the file to write
+        :param signature_char: file type character(s) for the header
+        :param executor: if given, the file is encoded and written by this executor when closing;
+                         the result is available as attribute `future`
+        """
         self._path = f
         self._signature = signature_char
         if len(signature_char) == 1:
             self._signature += '0'
         self._file = None
         self._parentheses = 0
+        self._executor = executor
+        self.future: Optional[Future] = None
 
     def __enter__(self):
-        self._file = open(self._path, 'w', encoding='UTF-16')
+        # content is collected in memory and encoded and written at once when closing
+        self._file = io.StringIO()
         self.write(f'SIMISA@@@@@@@@@@JINX0{self._signature}t______\n\n')
         return self
 
@@ -55,20 +93,56 @@ class STFOutput:
     def close(self):
         if self._file:
             self.close_parentheses()
+            content = self._file.getvalue()
             self._file.close()
+            if self._executor:
+                self.future = self._executor.submit(_write_stf_file, self._path, content)
+            else:
+                _write_stf_file(self._path, content)
 
     def write(self, content: str):
-        lines = content.splitlines()
-        indented_lines = ''
-        for line in lines:
+        # the file object buffers internally, so lines are written one by one instead of building a string
+        write = self._file.write
+        for line in content.splitlines():
             line = line.lstrip()
             indent = self._parentheses
             if line.startswith(')'):
                 indent -= 1
             assert indent >= 0, "unbalanced input"
-            indented_lines += '\t' * indent + line + '\n'
+            write(_TABS[indent] if indent < len(_TABS) else '\t' * indent)
+            write(line)
+            write('\n')
             self._parentheses += line.count('(') - line.count(')')
-        self._file.write(indented_lines)
+
+    def write_raw(self, line: str, delta_parens: int = 0):
+        """
+        Fast path for a single, already stripped line whose parentheses balance is known to the caller.
+        A line with negative balance must start with the closing parenthesis.
+
+        :param line: the line to write, without indentation and line break
+        :param delta_parens: number of opened minus number of closed parentheses in the line
+        """
+        indent = self._parentheses - 1 if delta_parens < 0 else self._parentheses
+        self._file.write(_TABS[indent] if indent < len(_TABS) else '\t' * indent)
+        self._file.write(line)
+        self._file.write('\n')
+        self._parentheses += delta_parens
+
+    def write_block(self, block: str, delta_parens: int = 0):
+        """
+        Fast path for a pre-formatted block of lines. All lines are indented relative to the current level,
+        a closing parenthesis at the start of a line must already be accounted for in the block.
+
+        :param block: the lines to write, without a final line break
+        :param delta_parens: number of opened minus number of closed parentheses in the block
+        """
+        indent = self._parentheses
+        prefix = _TABS[indent] if indent < len(_TABS) else '\t' * indent
+        if prefix:
+            block = prefix + block.replace('\n', '\n' + prefix)
+        self._file.write(block)
+        self._file.write('\n')
+        self._parentheses += delta_parens
 
     def close_parentheses(self):
         while self._parentheses > 0:
@@ -90,6 +164,8 @@ class _Indexer:
         self.key = key
         self.next_index = first_index
         self.indices: Dict[Any, int] = {}
+        # (object, index) pairs in insertion order, so iteration does not go through the dict
+        self._items: List[Tuple[Any, int]] = []
 
     def __getitem__(self, item):
         return self.get_or_add(item)
@@ -101,6 +177,7 @@ class _Indexer:
             idx = self.next_index
             self.next_index += 1
             self.indices[item] = idx
+            self._items.append((item, idx))
             item.attrs[self.key] = idx
             return idx
 
@@ -112,7 +189,7 @@ class _Indexer:
             self.get_or_add(item)
 
     def __iter__(self):
-        return iter(self.indices.items())
+        return iter(self._items)
 
     def __contains__(self, item):
         return item in self.indices
@@ -123,20 +200,21 @@ _EMPTY_TILE = _Indexer(OR_W_FILE_INDEX)
 
 def displayable(obj):
     shapefile = obj.attrs.get("shapefile", None)
-    if obj.render and not shapefile:
-        logging.warning("Adding an object without a shapefile to the OpenRails files, this may fail")
+    if obj.render and not shapefile and logger.isEnabledFor(logging.WARNING):
+        logger.warning("Adding object %s without a shapefile to the OpenRails files, this may fail",
+                       obj.name or obj.object_type)
     return obj.render and shapefile
 
 
 def pos2tile(pos: Vector, start_tile=DEFAULT_START_TILE):
     """
-    Get the tile for a 2D position
+    Get the tile for a 2D position. Positions exactly on a tile border belong to the upper tile.
     :param pos: the position
     :param start_tile: the start tile that position (0,0) maps to
     :return: tuple (tile X, tile Z)
     """
     x0, z0 = start_tile
-    return round(pos.x / TILE_SIZE) + x0, round(pos.y / TILE_SIZE) + z0
+    return math.floor(pos.x * _INV_TILE_SIZE + 0.5) + x0, math.floor(pos.y * _INV_TILE_SIZE + 0.5) + z0
 
 
 def pos2world(pos: Vector, z=0.0, tile: Tuple[int, int] = None, start_tile=DEFAULT_START_TILE):
@@ -149,11 +227,27 @@ def pos2world(pos: Vector, z=0.0, tile: Tuple[int, int] = None, start_tile=DEFAU
     :param start_tile: the start tile that position (0,0) maps to
     :return: tuple (tile X, tile Z, X, Y, Z)
     """
-    y = z + GROUND_LEVEL
-    tile_x, tile_z = tile or pos2tile(pos, start_tile)
-    x = pos.x - (tile_x - start_tile[0]) * TILE_SIZE
-    z = pos.y - (tile_z - start_tile[1]) * TILE_SIZE
-    return tile_x, tile_z, x, y, z
+    return pos2world_xy(pos.x, pos.y, z, tile, start_tile)
+
+
+def pos2world_xy(pos_x: float, pos_y: float, z=0.0, tile: Tuple[int, int] = None, start_tile=DEFAULT_START_TILE):
+    """
+    Same as pos2world, but for plain coordinates instead of a Vector
+
+    :param pos_x: X of the 2D coordinate to convert
+    :param pos_y: Y of the 2D coordinate to convert
+    :param z: Z value (height) of world coordinate
+    :param tile: the tile to use; derive from position if None
+    :param start_tile: the start tile that position (0,0) maps to
+    :return: tuple (tile X, tile Z, X, Y, Z)
+    """
+    x0, z0 = start_tile
+    if tile:
+        tile_x, tile_z = tile
+    else:
+        tile_x = math.floor(pos_x * _INV_TILE_SIZE + 0.5) + x0
+        tile_z = math.floor(pos_y * _INV_TILE_SIZE + 0.5) + z0
+    return tile_x, tile_z, pos_x - (tile_x - x0) * TILE_SIZE, z + GROUND_LEVEL, pos_y - (tile_z - z0) * TILE_SIZE
 
 
 class _TileManager(Dict[Tuple[int, int], _Indexer]):
@@ -173,16 +267,21 @@ class _TileManager(Dict[Tuple[int, int], _Indexer]):
         super().__init__()
         self.tile_x = tile_x
         self.tile_z = tile_z
+        # reverse lookup: the tile an object has been registered to
+        self._owner: Dict[Any, Tuple[int, int]] = {}
 
     def register(self, item, pos: Vector):
         tile = self.pos2tile(pos)
-        # we add also surrounding tiles, so we won't cross world boundaries
-        for i in [-1, 0, 1]:
-            for j in [-1, 0, 1]:
-                surrounding_tile = (tile[0] + i, tile[1] + j)
-                if surrounding_tile not in self:
-                    self[surrounding_tile] = _Indexer(OR_W_FILE_INDEX)
-        self[tile].register(item)
+        # we add also surrounding tiles, so we won't cross world boundaries.
+        # They share the empty sentinel until an object is registered to them
+        for i in (-1, 0, 1):
+            for j in (-1, 0, 1):
+                self.setdefault((tile[0] + i, tile[1] + j), _EMPTY_TILE)
+        indexer = self[tile]
+        if indexer is _EMPTY_TILE:
+            indexer = self[tile] = _Indexer(OR_W_FILE_INDEX)
+        indexer.register(item)
+        self._owner[item] = tile
         item.attrs[OR_TILE] = tile
 
     def pos2tile(self, pos: Vector):
@@ -229,15 +328,84 @@ class _TileManager(Dict[Tuple[int, int], _Indexer]):
         :param item: object to look up
         :return: tuple (tile X, tile Z, index) for the object
         """
-        for tile, indexer in self.items():
-            if item in indexer:
-                return tile[0], tile[1], indexer[item]
+        tile = self._owner[item]
+        return tile[0], tile[1], self[tile].indices[item]
+
+
+# templates for the world file entries, lines are indented relative to the first line
+_DYNTRACK_TEMPLATE = (
+    'Dyntrack (\n'
+    '\tUiD ( %s )\n'
+    '\tTrackSections (\n'
+    '\t\tTrackSection (\n'
+    '\t\t\tSectionCurve ( 0 ) %s %g %g \n'
+    '\t\t)\n'
+    '\t\tTrackSection (\n'
+    '\t\t\tSectionCurve ( 1 ) %s %g %g \n'
+    '\t\t)\n'
+    '\t\tTrackSection (\n'
+    '\t\t\tSectionCurve ( 0 ) 4294967295 0 0 \n'
+    '\t\t)\n'
+    '\t\tTrackSection (\n'
+    '\t\t\tSectionCurve ( 1 ) 4294967295 0 0 \n'
+    '\t\t)\n'
+    '\t\tTrackSection (\n'
+    '\t\t\tSectionCurve ( 0 ) 4294967295 0 0 \n'
+    '\t\t)\n'
+    '\t)\n'
+    '\tSectionIdx ( %s )\n'
+    '\tElevation ( 0 )\n'
+    '\tCollideFlags ( 39 )\n'
+    '\tStaticFlags ( 00100000 )\n'
+    '\tPosition ( %g %g %g )\n'
+    '\tQDirection ( 0 %g 0 %g )\n'
+    '\tVDbId ( 4294967295 )\n'
+    ')'
+)
+
+_STATIC_TEMPLATE = (
+    'Static (\n'
+    '\tUiD ( %s )\n'
+    '\tFileName ( %s )\n'
+    '\tStaticFlags ( %8x )\n'
+    '\tPosition ( %g %g %g )\n'
+    '\tQDirection ( 0 %g 0 %g )\n'
+    '\tVDbId ( 4294967295 )\n'
+    ')'
+)
+
+_SIGNAL_TEMPLATE = (
+    'Signal (\n'
+    '\tUiD ( %s )\n'
+    '\tFileName ( %s )\n'
+    '\tStaticFlags ( %8x )\n'
+    '\tPosition ( %g %g %g )\n'
+    '\tQDirection ( 0 %g 0 %g )\n'
+    '\tVDbId ( 4294967295 )\n'
+    '\tSignalSubObj ( 00000001 )\n'
+    '\tSignalUnits ( 1 \n'
+    '\t\tSignalUnit ( 0\n'
+    '\t\t\tTrItemId ( 0 %s )\n'
+    '\t\t)\n'
+    '\t)\n'
+    ')'
+)
+
+
+def _static_flags(obj: SceneryObject) -> int:
+    """
+    StaticFlags common to static objects and signals, animated objects must not be merged by OpenRails
+
+    :param obj: the scenery object
+    :return: the static flags
+    """
+    return 0x00090000 if obj.attrs.get('animated', False) else 0x00010000
 
 
 def _write_ts(f, curved, section=UNDEFINED, a=0.0, b=0.0):
-    f.write(f'      TrackSection (\n'
-            f'        SectionCurve ( {curved} ) {section} {a:g} {b:g} \n'
-            f'      )\n')
+    f.write_raw('TrackSection (', 1)
+    f.write_raw(f'SectionCurve ( {curved} ) {section} {a:g} {b:g} ')
+    f.write_raw(')', -1)
 
 
 class ORWriter:
@@ -253,10 +421,18 @@ class ORWriter:
         self._tdb_indices = _Indexer(OR_TDB_INDEX)
         self._tr_item_ids = _Indexer(OR_TR_ITEM_ID, 0)
         self._section_indices = _Indexer(OR_SECTION_INDEX, 40000)
+        # (w tile X, w tile Z, index in *.w file, tile X, tile Z, X, Y, Z) of the start of each segment
+        self._segment_locations: Dict[EdgeSegment, Tuple] = {}
+        # path section index (as in tsection.dat) of each segment
+        self._path_section_indices: Dict[EdgeSegment, int] = {}
+        # (reference pose on the track, direction flag) of each signal
+        self._signal_refs: Dict[SceneryObject, Tuple[Pose, int]] = {}
         self.graph = graph
         graph.attrs[OR_TILE] = (tile_x, tile_z)
         self._init_indices()
         self.template_folder = template_folder
+        # sub-directories already ensured to exist, so they are not checked for every file
+        self._existing_directories = set()
 
     def _init_indices(self):
         for edge in self.graph.edges:
@@ -265,12 +441,24 @@ class ORWriter:
             #     continue
             for segment in edge.segments:
                 self._world_indices.register(segment, segment.start.pos)
+                tile = segment.attrs[OR_TILE]
+                self._segment_locations[segment] = ((*tile, segment.attrs[OR_W_FILE_INDEX])
+                                                    + self._world_indices.pos2world(segment.start.pos, tile=tile))
             self._section_indices.register(*edge.segments)
+            for segment in edge.segments:
+                self._get_section_index(segment)
             self._tdb_indices.register(edge)
             for obj in edge.scenery_objects:
+                is_signal = obj.object_type == SIGNAL_TYPE
+                # write_tdb lists every rendered signal, also those without a shapefile
+                if is_signal and obj.render and isinstance(obj.relative_to, Edge):
+                    ref_pose = obj.relative_to.travel(obj.pose.pos.x)
+                    sig_dir = 1 if abs(angle_between(ref_pose.direction,
+                                                     obj.global_pose.direction)) <= 0.5 * math.pi else 0
+                    self._signal_refs[obj] = ref_pose, sig_dir
                 if not displayable(obj):
                     continue
-                if obj.object_type == SIGNAL_TYPE:
+                if is_signal:
                     self._tr_item_ids.register(obj)
                 self._world_indices.register(obj, obj.global_pose.pos)
 
@@ -281,10 +469,34 @@ class ORWriter:
             assert obj.object_type != SIGNAL_TYPE, "signals must be owned by edges"
             self._world_indices.register(obj, obj.global_pose.pos)
 
+        self._qdirections = self._init_qdirections()
+
+    def _init_qdirections(self) -> Dict[Any, Tuple[float, float]]:
+        """
+        Compute the QDirection sine and cosine for all objects in the world files at once
+
+        :return: dict object -> (sin, cos)
+        """
+        items = []
+        angles = []
+        for _, objects in self._world_indices.items():
+            for obj, _ in objects:
+                if isinstance(obj, EdgeSegment):
+                    pose, facing = obj.start, 'y'
+                elif obj.object_type == SIGNAL_TYPE:
+                    pose, facing = obj.global_pose, '-y'
+                else:
+                    pose, facing = obj.global_pose, 'x'
+                items.append(obj)
+                angles.append(pose.direction / 2.0 - _FACING_OFFSETS[facing])
+        angles = np.array(angles, dtype=np.float64)
+        return dict(zip(items, zip(np.sin(angles).tolist(), np.cos(angles).tolist())))
+
     def ensure_directory_exists(self, directory):
-        directory = os.path.join(self.directory, directory)
-        if not os.path.exists(directory):
-            os.mkdir(directory)
+        if directory in self._existing_directories:
+            return
+        os.makedirs(os.path.join(self.directory, directory), exist_ok=True)
+        self._existing_directories.add(directory)
 
     def get_w_file_name(self, tile_x, tile_z):
         return os.path.join(self.directory, 'world', f'w{tile_x:+07}{tile_z:+07}.w')
@@ -292,9 +504,13 @@ class ORWriter:
     def write_world_files(self):
         self.ensure_directory_exists('world')
         self.ensure_directory_exists('tiles')
-        with self.template() as template:
-            for tile, objects in self._world_indices.items():
-                with STFOutput(self.get_w_file_name(*tile), 'w') as f:
+        # the files are formatted here, encoding, writing and copying run in threads, since file I/O releases the GIL
+        with self.template() as template, ThreadPoolExecutor() as executor:
+            pending = []
+            # in order of the tile file names, so the files are created in Z-order of the tiles
+            tiles = sorted(self._world_indices.items(), key=lambda item: _geom_kernels.tile_index(*item[0]))
+            for tile, objects in tiles:
+                with STFOutput(self.get_w_file_name(*tile), 'w', executor) as f:
                     f.write('Tr_Worldfile (')
                     for obj, uid in objects:
                         if isinstance(obj, EdgeSegment):
@@ -305,107 +521,84 @@ class ORWriter:
                             else:
                                 self._write_static_object(f, obj, uid)
                     f.write(')\n')
+                pending.append(f.future)
                 tile_t, tile_raw = self._tile_file_names(*tile)
-                shutil.copy(os.path.join(template, 'tiles', 'template.t'), tile_t)
-                shutil.copy(os.path.join(template, 'tiles', 'template_y.raw'), tile_raw)
+                pending.append(executor.submit(shutil.copy, os.path.join(template, 'tiles', 'template.t'), tile_t))
+                pending.append(executor.submit(shutil.copy, os.path.join(template, 'tiles', 'template_y.raw'),
+                                               tile_raw))
+            for future in pending:
+                future.result()
 
     def _write_dyntrack(self, f, obj, uid):
-        f.write(f'Dyntrack (\n')
-        section_idx = self._get_section_index(obj)
-        f.write(f'UiD ( {uid} )\n')
-        f.write('TrackSections (\n')
+        section_idx = self._path_section_indices[obj]
         if obj.straight():
-            _write_ts(f, 0, section_idx, obj.length)
-            _write_ts(f, 1)
+            sections = (section_idx, obj.length, 0.0, UNDEFINED, 0.0, 0.0)
         else:
-            _write_ts(f, 0)
-            _write_ts(f, 1, section_idx, obj.length / obj.radius, abs(obj.radius))
-        _write_ts(f, 0)
-        _write_ts(f, 1)
-        _write_ts(f, 0)
-        f.write(f'    )\n'
-                f'    SectionIdx ( {self._section_indices[obj]} )\n'
-                f'    Elevation ( 0 )\n'
-                f'    CollideFlags ( 39 )\n'
-                f'    StaticFlags ( 00100000 )\n'
-                f'{self._position_and_qdirection(obj.start, DYNTRACK_Z_OFFSET, facing="y")}\n'
-                '    VDbId ( 4294967295 )\n'
-                '  )\n')
+            sections = (UNDEFINED, 0.0, 0.0, section_idx, obj.length / obj.radius, abs(obj.radius))
+        f.write_block(_DYNTRACK_TEMPLATE % (
+            uid, *sections, self._section_indices[obj],
+            *self._position_and_qdirection(obj.start, DYNTRACK_Z_OFFSET, facing="y", item=obj)))
 
     def _write_static_object(self, f, obj: SceneryObject, uid):
-        static_flags = 0x00010000
-        if obj.attrs.get('animated', False):
-            static_flags |= 0x00080000
-        static_flags |= (int(obj.attrs.get('classification', 0)) & 7) << 24
-        f.write(f'Static (\n'
-                f'UiD ( {uid} )\n'
-                f'FileName ( {obj.attrs.get("shapefile", str(obj.name or obj.object_type) + ".s")} )\n'
-                f'StaticFlags ( {static_flags:8x} )\n'
-                f'{self._position_and_qdirection(obj.global_pose, obj.attrs.get("z", 0.0))}\n'
-                f'VDbId ( {UNDEFINED} )\n'
-                ' )\n')
+        static_flags = _static_flags(obj) | (int(obj.attrs.get('classification', 0)) & 7) << 24
+        f.write_block(_STATIC_TEMPLATE % (
+            uid, obj.attrs.get("shapefile", str(obj.name or obj.object_type) + ".s"), static_flags,
+            *self._position_and_qdirection(obj.global_pose, obj.attrs.get("z", 0.0), item=obj)))
 
     def _write_signal_w(self, f, obj: SceneryObject, uid):
-        static_flags = 0x00010000
-        if obj.attrs.get('animated', False):
-            static_flags |= 0x00080000
-        f.write(f'Signal (\n'
-                f'    UiD ( {uid} )\n'
-                f'    FileName ( {obj.attrs.get("shapefile", "Signal.s")} )\n'
-                f'    StaticFlags ( {static_flags:8x} )\n'
-                f'    {self._position_and_qdirection(obj.global_pose, facing="-y")}\n'
-                f'    VDbId ( {UNDEFINED} )\n'
-                f'    SignalSubObj ( 00000001 )\n'
-                f'    SignalUnits ( 1 \n'
-                f'        SignalUnit ( 0\n'
-                f'            TrItemId ( 0 {self._tr_item_ids[obj]} )\n'
-                f'        )\n'
-                f'    )\n'
-                f')\n')
+        f.write_block(_SIGNAL_TEMPLATE % (
+            uid, obj.attrs.get("shapefile", "Signal.s"), _static_flags(obj),
+            *self._position_and_qdirection(obj.global_pose, facing="-y", item=obj), self._tr_item_ids[obj]))
         rg.DBG_TRAVEL = False
 
-    def _position_and_qdirection(self, pose: Pose, z=0.0, facing='x'):
-        if facing == 'x':
-            offset = 0.0
-        elif facing == 'y':
-            offset = 0.25 * math.pi
-        elif facing == '-x':
-            offset = 0.5 * math.pi
-        elif facing == '-y':
-            offset = 0.75 * math.pi
-        else:
-            raise ValueError("facing is none of 'x', 'y', '-x', '-y'")
+    def _position_and_qdirection(self, pose: Pose, z=0.0, facing='x', item=None):
+        """
+
+        :return: tuple (X, Y, Z, sin, cos) with the world position and the QDirection components
+        """
+        try:
+            offset = _FACING_OFFSETS[facing]
+        except KeyError:
+            raise ValueError("facing is none of 'x', 'y', '-x', '-y'") from None
 
         _, _, x, y, z = self._world_indices.pos2world(pose.pos, z)
-        return (
-            f'    Position ( {x:g} {y:g} {z:g} )\n'
-            f'    QDirection ( 0 {math.sin(pose.direction / 2.0 - offset):g} '
-            f'0 {math.cos(pose.direction / 2.0 - offset):g} )'
-        )
+        sin_cos = self._qdirections.get(item)
+        if sin_cos is None:
+            angle = pose.direction / 2.0 - offset
+            sin_cos = math.sin(angle), math.cos(angle)
+        return x, y, z, sin_cos[0], sin_cos[1]
 
     def write_tsection_file(self):
         with STFOutput(os.path.join(self.directory, 'tsection.dat'), 'T') as f:
             # TSRE counts non-existent sections also
             f.write(f'TrackSections ( {2 * len(self._section_indices)}\n')
-            for obj, idx in self._section_indices:
+            # section geometry as arrays, so angles and radii are computed in one go
+            sections = list(self._section_indices)
+            lengths = np.fromiter((obj.length for obj, _ in sections), dtype=np.float64, count=len(sections))
+            radii = np.fromiter((obj.radius for obj, _ in sections), dtype=np.float64, count=len(sections))
+            straight = radii == 0.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                angles = np.abs(lengths / radii)
+            radii = np.abs(radii)
+            for (_, idx), length, is_straight, angle, radius in zip(sections, lengths.tolist(), straight.tolist(),
+                                                                   angles.tolist(), radii.tolist()):
                 idx -= 20000
-                if obj.straight():
-                    _write_ts(f, 0, 2 * idx, obj.length, 0.0)
+                if is_straight:
+                    _write_ts(f, 0, 2 * idx, length, 0.0)
                 else:
-                    angle = abs(obj.length / obj.radius)
-                    radius = abs(obj.radius)
                     _write_ts(f, 1, 2 * idx, -angle, radius)
                     _write_ts(f, 1, 2 * idx + 1, angle, radius)
 
             f.write(f')\nSectionIdx ( {len(self._section_indices)}\n')
             for obj, idx in self._section_indices:
-                f.write(f'TrackPath ( {idx} 1 {self._get_section_index(obj)} )\n')
+                f.write(f'TrackPath ( {idx} 1 {self._path_section_indices[obj]} )\n')
             f.write(')')
 
     def write_tdb(self):
-        def _uid(item, pose, reserved='1'):
-            w_tile_x, w_tile_z, world = self._world_indices.tile_and_index(item)
-            tile_x, tile_z, x, y, z = self._world_indices.pos2world(pose.pos)
+        def _uid(item, pose, reserved='1', location=None):
+            if location is None:
+                location = self._world_indices.tile_and_index(item) + self._world_indices.pos2world(pose.pos)
+            w_tile_x, w_tile_z, world, tile_x, tile_z, x, y, z = location
             return (f'{w_tile_x} {w_tile_z} {world} {reserved} '
                     f'{tile_x} {tile_z} {x:g} {y:g} {z:g} '
                     f'0 {(-pose.direction - 0.5 * math.pi) % (2 * math.pi) - math.pi:g} 0')
@@ -434,8 +627,8 @@ class ORWriter:
                     f.write('TrVectorNode (')
                     f.write(f'TrVectorSections ( {len(obj.segments)}')
                     for segment in obj.segments:
-                        f.write(f'{self._get_section_index(segment)} {self._section_indices[segment]} '
-                                f'{_uid(segment, segment.start, "0 1 00")}')
+                        f.write(f'{self._path_section_indices[segment]} {self._section_indices[segment]} '
+                                f'{_uid(segment, segment.start, "0 1 00", self._segment_locations[segment])}')
                     f.write(')')
                     tr_items = [sig for sig in obj.scenery_objects if sig.object_type == SIGNAL_TYPE and sig.render]
                     if tr_items:
@@ -455,12 +648,10 @@ class ORWriter:
                 for item, idx in self._tr_item_ids:
                     assert isinstance(item.relative_to, Edge)
                     s = item.pose.pos.x
-                    ref_pose = item.relative_to.travel(s)
+                    ref_pose, sig_dir = self._signal_refs[item]
                     tile_x, tile_z, x, y, z = self._world_indices.pos2world(ref_pose.pos)
                     if item.object_type == SIGNAL_TYPE:
                         sig_type = item.attrs.get('signal_type', 'Ks')
-                        sig_dir = 1 if abs(
-                            angle_between(ref_pose.direction, item.global_pose.direction)) <= 0.5 * math.pi else 0
                         f.write('SignalItem (\n'
                                 f'TrItemId ( {idx} )\n'
                                 f'TrItemSData ( {s} 00000002 )\n'
@@ -473,27 +664,34 @@ class ORWriter:
         :param segment:
         :return: the path section index for an edge segment
         """
-        idx = self._section_indices[segment]
-        # TSRE assigns even indices to straight and left turn segments, and odd indices to right turns
-        if segment.radius <= 0.0:
-            return 2 * idx - 40000
-        else:
-            return 2 * idx - 40000 + 1
+        path_idx = self._path_section_indices.get(segment)
+        if path_idx is None:
+            idx = self._section_indices[segment]
+            # TSRE assigns even indices to straight and left turn segments, and odd indices to right turns
+            path_idx = 2 * idx - 40000 if segment.radius <= 0.0 else 2 * idx - 40000 + 1
+            self._path_section_indices[segment] = path_idx
+        return path_idx
 
     def write_path_file(self, filename: str, name: str, start_name: str, end_name: str, points: List[End]):
         locations = []
         started = False
         offset = points.start_offset if isinstance(points, Path) else 0.0
+        # per node: how many edges lead to each neighbour node
+        neighbour_counts: Dict[Node, Counter] = {}
         for end in points:
             if not started and offset > end.edge.length():
                 offset -= end.edge.length()
                 continue
             locations.append((end.travel(offset).pos, '2 0' if started else '1 1', '00000000'))
             # check if the edge to the next node is unique. Otherwise, insert an intermediate point
-            for other in end.node().ends():
-                if other != end and other.other_end().node() == end.other_end().node():
-                    locations.append((end.travel(end.edge.length() / 2.0).pos, '1 1', '00000004'))
-                    break
+            node = end.node()
+            counts = neighbour_counts.get(node)
+            if counts is None:
+                counts = Counter(e.source() for e in node.incoming)
+                counts.update(e.target() for e in node.outgoing)
+                neighbour_counts[node] = counts
+            if counts[end.other_end().node()] > 1:
+                locations.append((end.travel(end.edge.length() / 2.0).pos, '1 1', '00000004'))
             started = True
             offset = 0.0
         locations.append((points[-1].other_end().pose().pos, '1 1', '00000000'))
@@ -521,6 +719,15 @@ class ORWriter:
                 f.write(f'TrPathNode ( {flags} {nxt} {UNDEFINED} {pdp} )')
             f.write(')\n)')
 
+    def write_path_files(self, paths: Iterable[Tuple[str, str, str, str, List[End]]]):
+        """
+        Write several path files in one go
+
+        :param paths: tuples (filename, name, start_name, end_name, points) as passed to write_path_file
+        """
+        for filename, name, start_name, end_name, points in paths:
+            self.write_path_file(filename, name, start_name, end_name, points)
+
     def write_track_file(self):
         with STFOutput(os.path.join(self.directory, self.base_name + '.trk'), 'r1') as f:
             f.write(f'''
@@ -586,18 +793,11 @@ class ORWriter:
         if overwrite:
             with self.template() as template:
                 shutil.rmtree(self.directory)
+                self._existing_directories.clear()
                 shutil.copytree(template, self.directory, copy_function=copy_function)
 
     def _tile_file_names(self, tile_x: int, tile_z: int):
-        x = tile_x + (1 << 14)
-        z = tile_z + (1 << 14)
-        x = x ^ z
-        x = ~x
-        z = ~z
-        tile_idx = 0
-        for i in range(15):
-            tile_idx |= ((x & (1 << i)) | ((z & (1 << i)) << 1)) << i
-        tile_idx <<= 2
+        tile_idx = _geom_kernels.tile_index(tile_x, tile_z)
         basename = os.path.join(self.directory, 'tiles', f'-{tile_idx:08x}')
         return basename + '.t', basename + '_y.raw'
 
@@ -608,6 +808,53 @@ class ORWriter:
         self.write_world_files()
         self.write_tdb()
 
+    def route_hash(self, paths: Iterable[Tuple[str, str, str, str, List[End]]] = ()) -> str:
+        """
+        Hash of everything the route files are written from: the graph, the tile origin, the files of the route
+        template and the path definitions. Used to detect whether the route files need to be written again
+
+        :param paths: the path definitions that are passed to write_path_files
+        :return: the hash as hex string
+        """
+        route_hash = hashlib.blake2b(self.graph.to_json().encode('UTF-8'))
+        route_hash.update(repr(self.graph.attrs[OR_TILE]).encode('UTF-8'))
+        with self.template() as template:
+            for root, directories, files in os.walk(template):
+                directories.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    route_hash.update(repr(os.path.relpath(file_path, template).replace(os.sep, '/')).encode('UTF-8'))
+                    with open(file_path, 'rb') as f:
+                        route_hash.update(hashlib.blake2b(f.read()).digest())
+        edge_indices = {edge: idx for idx, edge in enumerate(self.graph.edges)}
+        for filename, name, start_name, end_name, points in paths:
+            offset = points.start_offset if isinstance(points, Path) else 0.0
+            ends = [(edge_indices[end.edge], end.side.value) for end in points]
+            route_hash.update(repr((filename, name, start_name, end_name, offset, ends)).encode('UTF-8'))
+        return route_hash.hexdigest()
+
+    def is_up_to_date(self, route_hash: str) -> bool:
+        """
+        Check whether the route files in the output directory have been written for a route with the given hash
+
+        :param route_hash: hash of the route, see route_hash()
+        :return: True if the route files are up to date, False otherwise
+        """
+        try:
+            with open(os.path.join(self.directory, ROUTE_HASH_FILE), 'r') as f:
+                return f.read() == route_hash
+        except FileNotFoundError:
+            return False
+
+    def save_route_hash(self, route_hash: str):
+        """
+        Store the hash of the route the route files have been written for
+
+        :param route_hash: hash of the route, see route_hash()
+        """
+        with open(os.path.join(self.directory, ROUTE_HASH_FILE), 'w') as f:
+            f.write(route_hash)
+
     def pos2world(self, pos: Vector, z=0.0, tile: Tuple[int, int] = None):
         return self._world_indices.pos2world(pos, z, tile)
 
@@ -2,10 +2,27 @@ import heapq
 import json
 import math
 from abc import abstractmethod
+from bisect import bisect_left
 from enum import Enum
+from itertools import accumulate
+from operator import indexOf
 from typing import Optional, List, Iterator, Iterable, Dict, Tuple, Union, Set, overload, Any
 
-from routecreation.geometry import Pose, polar, angle_between, Vector, biarc_interpolation
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional, without it nearest neighbour queries scan all points
+    cKDTree = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it graphs are serialized with the json module
+    orjson = None
+
+from routecreation import _geom_kernels
+from routecreation.geometry import Pose, polar, Vector, biarc_interpolation, biarc_interpolation_batch, \
+    _angle_diff, _polar_xy, _PI, _TWO_PI, _HALF_PI
 
 """
 Classes for railway graphs. 
@@ -18,15 +35,20 @@ this is the direction in that the track passes the node. For switches, the direc
 
 MIN_ANGLE = 0.0
 MAX_RADIUS = float('Inf')
+# nodes with at least this many incident edges check their tip direction with numpy
+_VECTORIZED_DEGREE = 6
 
 SIGNAL_TYPE = 'Signal'
 SENSOR_TYPE = 'Sensor'
 
 
 class RailgraphObject:
+    __slots__ = ('graph', '_index')
 
     def __init__(self, graph: 'Graph' = None):
         self.graph = graph
+        # position in the containing graph list, validated on use since the lists may be modified directly
+        self._index: Optional[int] = None
 
     @abstractmethod
     def to_global(self, other: Union['Pose', Vector]):
@@ -51,11 +73,38 @@ class RailgraphObject:
         """
         raise NotImplementedError
 
+    def _index_in(self, items: List['RailgraphObject']) -> int:
+        """
+        Index of this object in a list of the graph, using the cached index if it is still valid
+
+        :param items: the list of nodes, edges or scenery objects of the graph
+        :return: the index, or -1 if this object is not in the list
+        """
+        idx = self._index
+        if idx is not None and idx < len(items) and items[idx] is self:
+            return idx
+        try:
+            idx = indexOf(items, self)
+        except ValueError:
+            return -1
+        # the list has been modified, renumber all entries
+        _renumber(items)
+        return idx
+
+
+def _renumber(items: List[RailgraphObject]):
+    """
+    Reset the cached indices of all objects in a list of the graph
+    """
+    for idx, item in enumerate(items):
+        item._index = idx
+
 
 class SceneryObject(RailgraphObject):
     """
     This models an object in the scenery, e.g. an obstacle, signal, crossing, ...
     """
+    __slots__ = ('pose', 'object_type', 'name', 'attrs', 'render', 'relative_to')
 
     def __init__(self, pose: Pose, object_type: str = None, name: str = None,
                  relative_to: Union['Graph', 'Edge'] = None, render: bool = True, **attrs):
@@ -69,6 +118,7 @@ class SceneryObject(RailgraphObject):
             self.relative_to = relative_to
             relative_to.scenery_objects.append(self)
         else:
+            self._index = len(self.graph.scenery_objects)
             self.graph.scenery_objects.append(self)
             self.relative_to = None
 
@@ -102,8 +152,8 @@ class SceneryObject(RailgraphObject):
         return self.global_pose.to_local(other)
 
     def get_index(self):
-        if self.graph and self in self.graph.scenery_objects:
-            return self.graph.scenery_objects.index(self)
+        if self.graph:
+            return self._index_in(self.graph.scenery_objects)
         else:
             # TODO handle case for signals
             return -1
@@ -117,6 +167,7 @@ class Node(RailgraphObject):
     The lists of incoming and outgoing edges shall not be modified directly. They are managed by the edges itself.
 
     """
+    __slots__ = ('_pose', 'incoming', 'outgoing', '_ends_cache', 's', 'attrs')
 
     def __init__(self, pose: Pose, graph: 'Graph' = None, s=0.0):
         """
@@ -124,20 +175,43 @@ class Node(RailgraphObject):
         :param s: The node way
         """
         super().__init__(graph)
-        self.pose = pose
+        self._pose = pose
         self.incoming: List['Edge'] = []
         self.outgoing: List['Edge'] = []
+        # result of ends(), reset whenever the incident edges or the poses they depend on change
+        self._ends_cache: Optional[List['End']] = None
         self.s = s
         self.attrs = {}
         if self.graph:
+            self._index = len(self.graph.nodes)
             self.graph.nodes.append(self)
+            self.graph._node_index = None
+
+    @property
+    def pose(self) -> Pose:
+        """
+        The node pose
+        """
+        return self._pose
+
+    @pose.setter
+    def pose(self, pose: Pose):
+        self._pose = pose
+        self._ends_cache = None
+        if self.graph:
+            self.graph._node_index = None
+        # edges without segments take their end directions from the node positions
+        for edge in self.incoming:
+            edge._ends_changed()
+        for edge in self.outgoing:
+            edge._ends_changed()
 
     def directions(self):
         """
 
         :return: the directions of all the incident edges
         """
-        return [e.end().direction for e in self.incoming] + [e.start().direction for e in self.outgoing]
+        return [e._end_direction() for e in self.incoming] + [e._start_direction() for e in self.outgoing]
 
     def calculate_direction(self):
         """
@@ -152,20 +226,30 @@ class Node(RailgraphObject):
             self.pose = Pose(self.pose.pos, dirs[0])
             return True
         elif len(dirs) == 2:
-            if abs(angle_between(dirs[0], dirs[1])) <= 0.5 * math.pi:
+            d0, d1 = dirs
+            # _angle_diff inlined, this branch runs for most of the nodes
+            if abs((d1 - d0 + _PI) % _TWO_PI - _PI) <= _HALF_PI:
                 return False
             # direction is halfway on the curve
             # assume that the incoming edge is first, so direction shall be between d0 + pi and d1
-            self.pose = Pose(self.pose.pos, dirs[1] + angle_between(dirs[1], dirs[0] + math.pi) * 0.5)
+            self.pose = Pose(self.pose.pos, d1 + ((d0 + _PI - d1 + _PI) % _TWO_PI - _PI) * 0.5)
             return True
-        else:
+        elif len(dirs) < _VECTORIZED_DEGREE:
             for i in range(len(dirs)):
                 # assume that the tip is in direction d_i
                 # other directions d_j (j != i) have an angle > 120 deg to d_i
-                if all(abs(angle_between(dirs[i], d)) > 0.66 * math.pi
+                if all(abs(_angle_diff(dirs[i], d)) > 0.66 * math.pi
                        for d in dirs[:i] + dirs[i + 1:]):
                     self.pose = Pose(self.pose.pos, dirs[i])
                     return True
+        else:
+            # same check for all i at once: column i holds the angles between d_i and the other directions
+            angles = np.abs(np.mod(np.subtract.outer(dirs, dirs) + math.pi, 2 * math.pi) - math.pi)
+            np.fill_diagonal(angles, math.inf)
+            tips = np.flatnonzero(angles.min(axis=0) > 0.66 * math.pi)
+            if len(tips):
+                self.pose = Pose(self.pose.pos, dirs[tips[0]])
+                return True
         return False
 
     def degree(self):
@@ -177,15 +261,20 @@ class Node(RailgraphObject):
 
     def ends(self) -> List['End']:
         """
-        All the ends incident to this node, with the end at the tip first
+        All the ends incident to this node, with the end at the tip first.
+        The list is cached and shall not be modified.
 
         :return: the list of ends
         """
+        if self._ends_cache is not None:
+            return self._ends_cache
         ends = [e.target_end for e in self.incoming] + [e.source_end for e in self.outgoing]
 
         # the tip is the edge in direction of this node, so move this to top
-        ends.sort(key=lambda e: abs(angle_between(self.pose.direction, e.pose().direction)))
+        direction = self.pose.direction
+        ends.sort(key=lambda e: abs(_angle_diff(direction, e.direction())))
         ends[1:].sort(key=End.curvature)
+        self._ends_cache = ends
         return ends
 
     def connected_ends(self, end):
@@ -235,8 +324,8 @@ class Node(RailgraphObject):
         return self.pose.to_local(other)
 
     def get_index(self):
-        if self.graph and self in self.graph.nodes:
-            return self.graph.nodes.index(self)
+        if self.graph:
+            return self._index_in(self.graph.nodes)
         return -1
 
 
@@ -249,6 +338,7 @@ class End:
     """
     Models an end of an edge
     """
+    __slots__ = ('edge', 'side')
 
     def __init__(self, edge: 'Edge', side: EdgeEnd):
         self.edge = edge
@@ -260,6 +350,12 @@ class End:
         """
         return self.edge.start() if self.side == EdgeEnd.SOURCE else self.edge.end()
 
+    def direction(self) -> float:
+        """
+        :return: The direction of pose(), without creating the pose
+        """
+        return self.edge._start_direction() if self.side is EdgeEnd.SOURCE else self.edge._end_direction()
+
     def node(self):
         """
         :return: The node at this end
@@ -276,20 +372,17 @@ class End:
         """
         :return: Radius of the edge at this end
         """
-        if self.edge.segments:
-            if self.side == EdgeEnd.SOURCE:
-                return self.edge.segments[0].radius
-            else:
-                return -self.edge.segments[-1].radius
-        else:
+        segments = self.edge.segments
+        if not segments:
             return 0.0
+        return segments[0].radius if self.side is EdgeEnd.SOURCE else -segments[-1].radius
 
     def curvature(self):
         """
         :return: Curvature of the edge at this end
         """
         radius = self.radius()
-        return radius and 1.0 / radius
+        return 1.0 / radius if radius else 0.0
 
     def segment(self):
         """
@@ -321,6 +414,7 @@ class End:
                 segment.flip()
                 self.edge.segments.insert(0, segment)
                 self.node().s -= length
+            self.edge._ends_changed()
             self.node().pose = end_pose.copy()
 
             return self
@@ -362,6 +456,8 @@ class Edge(RailgraphObject):
     """
     Edges model tracks connecting nodes. Edges contain of sections (EdgeSection), which are either arcs or straight.
     """
+    __slots__ = ('_source', '_target', 'segments', '_segment_ends_cache', 'source_end', 'target_end', 'attrs',
+                 'scenery_objects')
 
     def __init__(self, source: Optional[Node] = None, target: Optional[Node] = None, graph: 'Graph' = None):
         """
@@ -375,13 +471,30 @@ class Edge(RailgraphObject):
         self._target = target
         target and target.incoming.append(self)
         self.segments: List[EdgeSegment] = []
+        # segment list and cumulative segment lengths, see _segment_ends
+        self._segment_ends_cache: Optional[Tuple[List[EdgeSegment], List[float]]] = None
         self.source_end = End(self, EdgeEnd.SOURCE)
         self.target_end = End(self, EdgeEnd.TARGET)
         self.attrs = {}
         self.scenery_objects: List[SceneryObject] = []
+        self._ends_changed()
         if self.graph:
+            self._index = len(self.graph.edges)
             self.graph.edges.append(self)
 
+    def _ends_changed(self):
+        """
+        Reset the cached ends of the source and target node, after the edge has been connected, disconnected
+        or its segments have changed
+        """
+        if self._source:
+            self._source._ends_cache = None
+        if self._target:
+            self._target._ends_cache = None
+        if self.graph:
+            self.graph._edge_index = None
+            self.graph._path_index = None
+
     def flip(self):
         """
         Reverse this edge (exchange source and target). Segments are also reversed.
@@ -393,14 +506,23 @@ class Edge(RailgraphObject):
         self._target and self._target.incoming.append(self)
         self._source and self._source.outgoing.append(self)
 
-        for segment in self.segments:
+        segments = self.segments
+        cache = self._segment_ends_cache
+        for segment in segments:
             segment.flip()
-        self.segments.reverse()
+        segments.reverse()
+        if cache is not None and cache[0] is segments and len(cache[1]) == len(segments):
+            # the segment lengths do not change, mirror the cached ends so the length stays the same
+            ends = cache[1]
+            total = ends[-1]
+            self._segment_ends_cache = (segments, [total - e for e in reversed(ends[:-1])] + [total])
+        else:
+            self._segment_ends_cache = None
+        self._ends_changed()
         for obj in self.scenery_objects:
             if obj.relative_to == self:
-                obj.pose = obj.pose.reverse()
-                obj.pose.pos.x = self.length() - obj.pose.pos.x
-                obj.pose.pos.y *= -1
+                pose = obj.pose.reverse()
+                obj.pose = Pose(Vector(self.length() - pose.pos.x, -pose.pos.y), pose.direction)
 
     def source(self):
         """
@@ -421,9 +543,11 @@ class Edge(RailgraphObject):
         :param source: new source
         """
         if source != self._source:
+            self._ends_changed()
             self._source and self._source.outgoing.remove(self)
             source and source.outgoing.append(self)
             self._source = source
+            self._ends_changed()
 
     def set_target(self, target: Node):
         """
@@ -432,9 +556,11 @@ class Edge(RailgraphObject):
         :param target: new target
         """
         if target != self._target:
+            self._ends_changed()
             self._target and self._target.incoming.remove(self)
             target and target.incoming.append(self)
             self._target = target
+            self._ends_changed()
 
     def start(self):
         """
@@ -448,6 +574,30 @@ class Edge(RailgraphObject):
             q = self._target.pose.pos
             return Pose(p, (q - p).alpha())
 
+    def _start_direction(self) -> float:
+        """
+        Direction of start(), without creating the pose
+        """
+        if self.segments:
+            return self.segments[0].start.direction
+        p = self._source.pose.pos
+        q = self._target.pose.pos
+        return math.atan2(q.y - p.y, q.x - p.x) % _TWO_PI
+
+    def _end_direction(self) -> float:
+        """
+        Direction of end(), without creating the pose
+        """
+        if self.segments:
+            segment = self.segments[-1]
+            direction = segment.start.direction
+            if segment.radius != 0.0:
+                direction -= segment.length / segment.radius
+            return (direction % _TWO_PI + _PI) % _TWO_PI
+        p = self._target.pose.pos
+        q = self._source.pose.pos
+        return math.atan2(q.y - p.y, q.x - p.x) % _TWO_PI
+
     def end(self):
         """
 
@@ -467,11 +617,11 @@ class Edge(RailgraphObject):
         :return: None
         """
         start = self._source.pose
-        if abs(angle_between(start.direction, self.start().direction)) > 0.5 * math.pi:
+        if abs(_angle_diff(start.direction, self.start().direction)) > 0.5 * math.pi:
             start = start.reverse()
 
         end = self._target.pose
-        if abs(angle_between(end.direction, self.end().direction)) <= 0.5 * math.pi:
+        if abs(_angle_diff(end.direction, self.end().direction)) <= 0.5 * math.pi:
             end = end.reverse()
 
         p1 = start.pos
@@ -480,7 +630,7 @@ class Edge(RailgraphObject):
         t2 = polar(end.direction)
         t = polar(self.start().direction)
 
-        if abs(t1 @ t) + abs(t2 @ t) < 0.0001:
+        if abs(t1.cross(t)) + abs(t2.cross(t)) < 0.0001:
             self.segments = [EdgeSegment(self.start(), abs(end.pos - start.pos))]
         else:
             r1, theta1, r2, theta2 = biarc_interpolation(p1, t1, p2, t2)
@@ -497,14 +647,50 @@ class Edge(RailgraphObject):
                     r2 = -r2
                 s2 = EdgeSegment(s1.end().reverse(), l2, r2)
                 self.segments = [s1, s2]
+        self._ends_changed()
+
+    def _segment_ends(self) -> List[float]:
+        """
+        Way at the end of each segment (cumulative segment lengths). The cache is rebuilt if the segment list is
+        replaced or its size changes; flip mirrors it since reversing keeps the size.
+
+        :return: list with one entry per segment
+        """
+        segments = self.segments
+        cache = self._segment_ends_cache
+        if cache is None or cache[0] is not segments or len(cache[1]) != len(segments):
+            cache = (segments, list(accumulate(segment.length for segment in segments)))
+            self._segment_ends_cache = cache
+        return cache[1]
+
+    def _extend_segments(self, segments: List['EdgeSegment']):
+        """
+        Append segments to this edge, extending the cached segment ends instead of rebuilding them
+
+        :param segments: the segments to append
+        """
+        if len(segments) > len(self.segments):
+            # cheaper to rebuild the cached ends when they are needed
+            self.segments.extend(segments)
+            self._segment_ends_cache = None
+        else:
+            ends = self._segment_ends()
+            total = ends[-1] if ends else 0.0
+            self.segments.extend(segments)
+            for segment in segments:
+                total += segment.length
+                ends.append(total)
+        self._ends_changed()
 
     def length(self):
         if self.segments:
-            return sum(segment.length for segment in self.segments)
+            return self._segment_ends()[-1]
         else:
-            return abs(self._source.pose.pos - self._target.pose.pos)
+            p = self._source.pose.pos
+            q = self._target.pose.pos
+            return math.hypot(p.x - q.x, p.y - q.y)
 
-    def to_global(self, other, offset: Optional[float] = 0.0, extend_before=True, extend_after=True):
+    def to_global(self, other, offset: Optional[float] = 0.0, extend_before=True, extend_after=True, reverse=False):
         """
                 Transform from local to global coordinates
 
@@ -512,12 +698,23 @@ class Edge(RailgraphObject):
                 :param offset: offset along path
                 :param extend_before: whether to transform coordinates before path start
                 :param extend_after: whether to transform coordinates after path end
+                :param reverse: if True, use the coordinates of the flipped edge, without flipping it
                 """
+        if reverse:
+            if offset is None:
+                offset = self._target.s
+            return self.to_global(_reverse_local(other, offset + self.length()), 0.0, extend_after, extend_before)
         if offset is None:
             offset = self._source.s
         if not self.segments:
-            EdgeSegment(self.start(), self.length()).to_global(other, offset, extend_before, extend_after)
-        for idx, segment in enumerate(self.segments):
+            return EdgeSegment(self.start(), self.length()).to_global(other, offset, extend_before, extend_after)
+        # skip the segments that end before the transformed point
+        ends = self._segment_ends()
+        first = min(bisect_left(ends, (other.pos.x if isinstance(other, Pose) else other.x) - offset), len(ends) - 1)
+        if first > 0:
+            offset += ends[first - 1]
+        for idx in range(first, len(self.segments)):
+            segment = self.segments[idx]
             transformed = segment.to_global(other, offset,
                                             extend_before and idx == 0,
                                             extend_after and idx == len(self.segments) - 1)
@@ -525,7 +722,7 @@ class Edge(RailgraphObject):
             if transformed:
                 return transformed
 
-    def to_local(self, other, offset: Optional[float] = 0.0, extend_before=True, extend_after=True):
+    def to_local(self, other, offset: Optional[float] = 0.0, extend_before=True, extend_after=True, reverse=False):
         """
                 Transform from global to local coordinates
 
@@ -533,7 +730,26 @@ class Edge(RailgraphObject):
                 :param offset: offset along path
                 :param extend_before: whether to transform coordinates before path start
                 :param extend_after: whether to transform coordinates after path end
+                :param reverse: if True, use the coordinates of the flipped edge, without flipping it
                 """
+        if reverse:
+            if offset is None:
+                offset = self._target.s
+            length = self.length()
+            if not self.segments:
+                transformed = EdgeSegment(self.start(), length).to_local(other, 0.0, extend_after, extend_before)
+                return None if transformed is None else _reverse_local(transformed, offset + length)
+            # the flipped edge has the segments in reverse order, so they are searched from the last one, with the
+            # extension flags of each segment swapped
+            ends = self._segment_ends()
+            for idx in range(len(self.segments) - 1, -1, -1):
+                segment = self.segments[idx]
+                transformed = segment.to_local(other, ends[idx] - segment.length,
+                                               extend_after and idx == 0,
+                                               extend_before)
+                if transformed:
+                    return _reverse_local(transformed, offset + length)
+            return None
         if offset is None:
             offset = self._source.s
         if not self.segments:
@@ -548,17 +764,50 @@ class Edge(RailgraphObject):
 
     def travel(self, s):
         if not self.segments:
-            return Pose(self.start().pos + polar(self.start().direction, s), self.start().direction)
+            start = self.start()
+            return Pose(Vector(start.pos.x + start._cos * s, start.pos.y + start._sin * s), start.direction)
         else:
-            for segment in self.segments[:-1]:
-                if s <= segment.length:
-                    return segment.travel(s)
-                s -= segment.length
-            return self.segments[-1].travel(s)
+            ends = self._segment_ends()
+            idx = min(bisect_left(ends, s), len(ends) - 1)
+            if idx > 0:
+                s -= ends[idx - 1]
+            return self.segments[idx].travel(s)
+
+    def travel_many(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized travel for many ways along this edge at once, see travel
+
+        :param s: array of ways from the edge start
+        :return: tuple (x, y, direction) of arrays with the shape of s, directions in the range [0, 2pi)
+        """
+        s = np.asarray(s, dtype=float)
+        if not self.segments:
+            start = self.start()
+            return (start.pos.x + start._cos * s, start.pos.y + start._sin * s,
+                    np.full(s.shape, start.direction))
+        ends = self._segment_ends()
+        idx = np.minimum(np.searchsorted(ends, s), len(ends) - 1)
+        s = s - np.array([0.0] + ends[:-1])[idx]
+
+        segments = self.segments
+        sx = np.array([segment.start.pos.x for segment in segments])[idx]
+        sy = np.array([segment.start.pos.y for segment in segments])[idx]
+        sdir = np.array([segment.start.direction for segment in segments])[idx]
+        radius = np.array([segment.radius for segment in segments])[idx]
+        straight = radius == 0.0
+        radius = np.where(straight, 1.0, radius)
+
+        angle = np.where(straight, 0.0, s / radius)
+        beta = sdir + _HALF_PI - angle
+        cx = sx + np.cos(sdir - _HALF_PI) * radius
+        cy = sy + np.sin(sdir - _HALF_PI) * radius
+        x = np.where(straight, sx + np.cos(sdir) * s, cx + np.cos(beta) * radius)
+        y = np.where(straight, sy + np.sin(sdir) * s, cy + np.sin(beta) * radius)
+        return x, y, np.mod(sdir - angle, 2 * math.pi)
 
     def get_index(self):
-        if self.graph and self in self.graph.edges:
-            return self.graph.edges.index(self)
+        if self.graph:
+            return self._index_in(self.graph.edges)
         return -1
 
     def __repr__(self):
@@ -574,6 +823,7 @@ class EdgeSegment:
     - radius = 0: straight segment
     - radius > 0: right curve arc
     """
+    __slots__ = ('start', 'length', 'radius', 'attrs')
 
     def __init__(self, start: Pose, length: float, radius=0.0):
         """
@@ -611,13 +861,10 @@ class EdgeSegment:
         return self.travel(self.length).reverse()
 
     def travel(self, s: float):
-        if self.straight():
-            return Pose(self.start.pos + polar(self.start.direction, s), self.start.direction)
-        else:
-            center = self.center()
-            angle = s / self.radius
-            beta = self.start.direction + 0.5 * math.pi - angle
-            return Pose(center + polar(beta, self.radius), self.start.direction - angle)
+        start = self.start
+        x, y, direction = _geom_kernels.segment_travel(start.pos.x, start.pos.y, start.direction,
+                                                       start._cos, start._sin, self.radius, s)
+        return Pose(Vector(x, y), direction)
 
     def flip(self):
         """
@@ -631,8 +878,8 @@ class EdgeSegment:
         """
         The center of the circle followed by this track segment
         """
-        alpha = self.start.direction - 0.5 * math.pi
-        return self.start.pos + polar(alpha, self.radius)
+        x, y = _polar_xy(self.start.direction - _HALF_PI)
+        return Vector(self.start.pos.x + x * self.radius, self.start.pos.y + y * self.radius)
 
     def to_global(self, other: Union[Vector, Pose], offset=0.0, extend_before=True, extend_after=True):
         if isinstance(other, Pose):
@@ -645,13 +892,13 @@ class EdgeSegment:
             return None
         if x > self.length and not extend_after:
             return None
-        q = self.travel(x)
-        vy = polar(q.direction).ortho()
-        p = q.pos + vy * y
+        start = self.start
+        px, py, direction = _geom_kernels.segment_to_global(start.pos.x, start.pos.y, start.direction,
+                                                            start._cos, start._sin, self.radius, x, y)
         if isinstance(other, Pose):
-            return Pose(p, other.direction + q.direction)
+            return Pose(Vector(px, py), other.direction + direction)
         else:
-            return p
+            return Vector(px, py)
 
     def to_local(self, other: Union[Vector, Pose], offset=0.0, extend_before=True, extend_after=True):
         """
@@ -664,19 +911,11 @@ class EdgeSegment:
                 """
         q = self.start
         if not self.straight():
-            c = self.center()
             if isinstance(other, Pose):
                 p = other.pos
             else:
                 p = other
-            d = abs(p - c)
-            if self.radius > 0:
-                y = d - self.radius
-                angle = (self.start.direction + 0.5 * math.pi - (p - c).alpha()) % (2 * math.pi)
-            else:
-                y = -self.radius - d
-                angle = ((p - c).alpha() + 0.5 * math.pi - self.start.direction) % (2 * math.pi)
-            s = angle * abs(self.radius)
+            s, y, angle = _geom_kernels.arc_to_local(q.pos.x, q.pos.y, q.direction, self.radius, p.x, p.y)
             if s <= self.length:
                 x = offset + s
                 if isinstance(other, Pose):
@@ -715,6 +954,71 @@ class Graph:
         self.edges: List[Edge] = []
         self.scenery_objects: List[SceneryObject] = []
         self.attrs = {}
+        # spatial indices for nearest_node and nearest_edge, built on demand and reset when nodes or edges change
+        self._node_index: Optional[Tuple[List[Node], '_PointIndex']] = None
+        self._edge_index: Optional[Tuple[float, List[Edge], np.ndarray, '_PointIndex']] = None
+        # the ends and their connections as arrays for the compiled shortest path search, built on demand
+        self._path_index: Optional['_PathIndex'] = None
+
+    def _nodes_changed(self):
+        """
+        Update the cached indices after nodes have been added or removed
+        """
+        _renumber(self.nodes)
+        self._node_index = None
+        self._path_index = None
+
+    def _get_path_index(self) -> '_PathIndex':
+        """
+        :return: the path index of this graph, rebuilt if nodes or edges have changed
+        """
+        index = self._path_index
+        if index is None or len(index.edges) != len(self.edges) or len(index.nodes) != len(self.nodes):
+            index = self._path_index = _PathIndex(self)
+        return index
+
+    def nearest_node(self, point: Vector) -> Optional[Node]:
+        """
+        Find the node closest to a point
+
+        :param point: the point
+        :return: the closest node, or None if the graph has no nodes
+        """
+        if self._node_index is None or len(self._node_index[0]) != len(self.nodes):
+            nodes = list(self.nodes)
+            self._node_index = nodes, _PointIndex(np.array([(n.pose.pos.x, n.pose.pos.y) for n in nodes],
+                                                           dtype=float).reshape(-1, 2))
+        nodes, index = self._node_index
+        return nodes[index.nearest(point.x, point.y)] if nodes else None
+
+    def nearest_edge(self, point: Vector, spacing: float = 1.0) -> Optional[Edge]:
+        """
+        Find the edge closest to a point. The edges are sampled every `spacing` meters, so the result is exact up to
+        half of the spacing.
+
+        :param point: the point
+        :param spacing: distance of the samples along the edges
+        :return: the closest edge, or None if the graph has no edges
+        """
+        if (self._edge_index is None or self._edge_index[0] != spacing
+                or len(self._edge_index[1]) != len(self.edges)):
+            edges = list(self.edges)
+            xs, ys, owners = [], [], []
+            for idx, edge in enumerate(edges):
+                length = edge.length()
+                x, y, _ = edge.travel_many(np.linspace(0.0, length, max(2, int(math.ceil(length / spacing)) + 1)))
+                xs.append(x)
+                ys.append(y)
+                owners.append(np.full(len(x), idx))
+            if edges:
+                points = np.column_stack((np.concatenate(xs), np.concatenate(ys)))
+                owners = np.concatenate(owners)
+            else:
+                points = np.empty((0, 2))
+                owners = np.empty(0, dtype=int)
+            self._edge_index = spacing, edges, owners, _PointIndex(points)
+        _, edges, owners, index = self._edge_index
+        return edges[owners[index.nearest(point.x, point.y)]] if edges else None
 
     def set_directions(self):
         """
@@ -733,10 +1037,11 @@ class Graph:
                     # print('split')
                     # we have a crossing
                     ends = node.ends()
+                    directions = [end.direction() for end in ends]
                     opposite = 1
                     for i in range(2, len(ends)):
-                        if abs(angle_between(ends[0].pose().direction, ends[i].pose().direction)) > \
-                                abs(angle_between(ends[0].pose().direction, ends[opposite].pose().direction)):
+                        if abs(_angle_diff(directions[0], directions[i])) > \
+                                abs(_angle_diff(directions[0], directions[opposite])):
                             opposite = i
                     # print(math.degrees(abs(angle_between(ends[0].pose().direction, ends[opposite].pose().direction))))
                     ends[0].set_node(new_node)
@@ -744,6 +1049,7 @@ class Graph:
                 new_node.calculate_direction()
 
         self.nodes.extend(new_nodes.keys())
+        self._nodes_changed()
         return new_nodes
 
     def remove_edge(self, edge):
@@ -753,6 +1059,7 @@ class Graph:
         edge.set_source(None)
         edge.set_target(None)
         self.edges.remove(edge)
+        _renumber(self.edges)
 
     def remove_node(self, node):
         """
@@ -761,13 +1068,86 @@ class Graph:
         for edge in node.incoming + node.outgoing:
             self.remove_edge(edge)
         self.nodes.remove(node)
+        self._nodes_changed()
 
     def create_segments(self):
         """
-        Create segments for all edges in this graph, using bi-arc interpolation
-        """
-        for edge in self.edges:
-            edge.create_biarcs()
+        Create segments for all edges in this graph, using bi-arc interpolation.
+        Same result as Edge.create_biarcs for each edge, but the bi-arcs of all edges are computed at once.
+        """
+        edges = self.edges
+        if not edges:
+            return
+        sources = [edge._source.pose for edge in edges]
+        targets = [edge._target.pose for edge in edges]
+
+        def directions(poses: List[Pose]) -> np.ndarray:
+            return np.fromiter((pose.direction for pose in poses), float, len(poses))
+
+        def positions(poses: List[Pose]) -> np.ndarray:
+            return np.array([(pose.pos.x, pose.pos.y) for pose in poses], dtype=float)
+
+        def angles_between(alpha, beta):
+            return np.mod(beta - alpha + math.pi, 2 * math.pi) - math.pi
+
+        def tangents(direction):
+            return np.column_stack((np.cos(direction), np.sin(direction)))
+
+        source_dir = directions(sources)
+        target_dir = directions(targets)
+        start_dir = np.fromiter((edge._start_direction() for edge in edges), float, len(edges))
+        end_dir = np.fromiter((edge._end_direction() for edge in edges), float, len(edges))
+        # orient the node poses along the edge, as in Edge.create_biarcs
+        reverse_start = np.abs(angles_between(source_dir, start_dir)) > 0.5 * math.pi
+        reverse_end = np.abs(angles_between(target_dir, end_dir)) <= 0.5 * math.pi
+        d1 = np.where(reverse_start, np.mod(source_dir + math.pi, 2 * math.pi), source_dir)
+        d2 = np.where(reverse_end, np.mod(target_dir + math.pi, 2 * math.pi), target_dir)
+
+        p1 = positions(sources)
+        p2 = positions(targets)
+        t1 = tangents(d1)
+        t2 = tangents(d2)
+        t = tangents(start_dir)
+        cross1 = t1[:, 0] * t[:, 1] - t1[:, 1] * t[:, 0]
+        cross2 = t2[:, 0] * t[:, 1] - t2[:, 1] * t[:, 0]
+        straight = np.abs(cross1) + np.abs(cross2) < 0.0001
+        lengths = np.hypot(p2[:, 0] - p1[:, 0], p2[:, 1] - p1[:, 1])
+
+        curved = np.flatnonzero(~straight)
+        r1 = np.zeros(len(edges))
+        theta1 = np.zeros(len(edges))
+        r2 = np.zeros(len(edges))
+        theta2 = np.zeros(len(edges))
+        if len(curved):
+            r1[curved], theta1[curved], r2[curved], theta2[curved] = biarc_interpolation_batch(
+                p1[curved], t1[curved], p2[curved], t2[curved])
+        straight |= (np.abs(theta1) < MIN_ANGLE) | (r1 > MAX_RADIUS) | (np.abs(theta2) < MIN_ANGLE) | (r2 > MAX_RADIUS)
+        l1 = np.abs(theta1 * r1)
+        l2 = np.abs(theta2 * r2)
+        r1 = np.where(theta1 > 0.0, -r1, r1)
+        r2 = np.where(theta2 < 0.0, -r2, r2)
+
+        # the second arc starts where the first one ends (see EdgeSegment.travel), the direction is normalized
+        # the same way as by the pose reversal in Edge.create_biarcs
+        arc = r1 != 0.0
+        radius = np.where(arc, r1, 1.0)
+        angle = np.where(arc, l1 / radius, 0.0)
+        beta = d1 + 0.5 * math.pi - angle
+        mid_x = np.where(arc, p1[:, 0] + np.cos(d1 - 0.5 * math.pi) * radius + np.cos(beta) * radius,
+                         p1[:, 0] + t1[:, 0] * l1)
+        mid_y = np.where(arc, p1[:, 1] + np.sin(d1 - 0.5 * math.pi) * radius + np.sin(beta) * radius,
+                         p1[:, 1] + t1[:, 1] * l1)
+        mid_dir = np.mod(np.mod(np.mod(d1 - angle, 2 * math.pi) + math.pi, 2 * math.pi) + math.pi, 2 * math.pi)
+
+        for i, (edge, is_straight, length, a1, a2, mx, my, md) in enumerate(zip(
+                edges, straight.tolist(), lengths.tolist(), zip(l1.tolist(), r1.tolist()),
+                zip(l2.tolist(), r2.tolist()), mid_x.tolist(), mid_y.tolist(), mid_dir.tolist())):
+            if is_straight:
+                edge.segments = [EdgeSegment(edge.start(), length)]
+            else:
+                start = sources[i].reverse() if reverse_start[i] else sources[i]
+                edge.segments = [EdgeSegment(start, *a1), EdgeSegment(Pose(Vector(mx, my), md), *a2)]
+            edge._ends_changed()
 
     def contract_edges(self) -> Dict[Union[Node, Edge], Edge]:
         """
@@ -776,17 +1156,22 @@ class Graph:
         :return: a map from the removed elements to the edges they have been merged into.
         """
         removed = {}
-        for node in list(self.nodes):
+        # nodes and edges are removed from the graph lists in one pass at the end
+        removed_nodes: Set[Node] = set()
+        removed_edges: Set[Edge] = set()
+        for node in self.nodes:
             if node.degree() == 2:
                 edges = node.incoming + node.outgoing
                 if edges[0] == edges[1]:
                     # this is a self loop and we can't do anything
                     # print('self loop')
                     continue
+                # one of the edges needs to be reversed, take the one with less segments and objects to reverse,
+                # the other one may already be a long chain of contracted edges
                 if len(node.incoming) == 2:
-                    node.incoming[1].flip()
+                    _cheaper_to_flip(*node.incoming).flip()
                 if len(node.outgoing) == 2:
-                    node.outgoing[1].flip()
+                    _cheaper_to_flip(*node.outgoing).flip()
                 assert len(node.incoming) == 1
                 assert len(node.outgoing) == 1
                 e1 = node.incoming[0]
@@ -795,14 +1180,21 @@ class Graph:
                 for obj in e2.scenery_objects:
                     if obj.relative_to == e2:
                         obj.relative_to = e1
-                        obj.pose.pos.x += e1.length()
+                        obj.pose = Pose(Vector(obj.pose.pos.x + e1.length(), obj.pose.pos.y), obj.pose.direction)
                     e1.scenery_objects.append(obj)
                 e2.scenery_objects.clear()
-                e1.segments.extend(e2.segments)
-                self.remove_edge(e2)
+                e1._extend_segments(e2.segments)
+                e2.set_source(None)
+                e2.set_target(None)
+                removed_edges.add(e2)
                 removed[node] = e1
                 removed[e2] = e1
-                self.nodes.remove(node)
+                removed_nodes.add(node)
+        if removed:
+            self.nodes[:] = [node for node in self.nodes if node not in removed_nodes]
+            self.edges[:] = [edge for edge in self.edges if edge not in removed_edges]
+            self._nodes_changed()
+            _renumber(self.edges)
         return removed
 
     def remove_unconnected_nodes(self):
@@ -811,6 +1203,7 @@ class Graph:
         """
         size = len(self.nodes)
         self.nodes = [n for n in self.nodes if n.degree() > 0]
+        self._nodes_changed()
         # if len(self.nodes) < size:
         #    print(f'remove {len(self.nodes) - size} of {size} unconnected nodes')
 
@@ -836,44 +1229,68 @@ class Graph:
         """
         return [node for node in self.nodes if node.degree() == 1]
 
+    def shortest_path(self, start: Union[Node, 'End'], end_node: Node) -> 'Path':
+        """
+        Find the shortest drivable path from a node or end to another node of this graph, see find_shortest_path
+
+        :param start: start node, or the end to leave the start node by
+        :param end_node: destination node
+        :return: the path
+        """
+        return find_shortest_path(start, end_node)
+
     def make_directed(self):
         """
         Ensure that all drivable paths are directed
         """
-        visited: Set[Union[Edge, Node]] = set()
-
-        def _make_directed(end: End, forward: bool):
-            s = end.node().s
-            end = end.other_end()
-            curr_node = end.node()
-            if end.edge in visited:
-                return
-            visited.add(end.edge)
-            if curr_node not in visited:
-                visited.add(curr_node)
-                curr_node.s = (s + end.edge.length()) if forward else (s - end.edge.length())
-
-                ends = curr_node.ends()
-                if end == ends[0]:
-                    for e in ends[1:]:
-                        _make_directed(e, forward)
-                else:
-                    _make_directed(ends[0], forward)
-                    for e in ends[1:]:
-                        if e != end:
-                            _make_directed(e, not forward)
-            if (end.side == EdgeEnd.TARGET) ^ forward:
-                end.edge.flip()
+        visited_nodes: Set[Node] = set()
+        visited_edges: Set[Edge] = set()
+
+        def _make_directed(start: End, forward: bool):
+            # depth-first traversal with an explicit stack, so long tracks do not exceed the recursion limit.
+            # Entries are (end, forward, leaving): leaving ends are followed to the next node, the others are the
+            # ends at which an edge has been entered, their edge is flipped after all following edges are done.
+            stack: List[Tuple[End, bool, bool]] = [(start, forward, True)]
+            while stack:
+                end, forward, leaving = stack.pop()
+                if not leaving:
+                    if (end.side == EdgeEnd.TARGET) ^ forward:
+                        end.edge.flip()
+                    continue
+                s = end.node().s
+                end = end.other_end()
+                curr_node = end.node()
+                if end.edge in visited_edges:
+                    continue
+                visited_edges.add(end.edge)
+                stack.append((end, forward, False))
+                if curr_node not in visited_nodes:
+                    visited_nodes.add(curr_node)
+                    curr_node.s = (s + end.edge.length()) if forward else (s - end.edge.length())
+
+                    ends = curr_node.ends()
+                    if end == ends[0]:
+                        following = [(e, forward, True) for e in ends[1:]]
+                    else:
+                        following = [(ends[0], forward, True)] + [(e, not forward, True) for e in ends[1:] if e != end]
+                    stack.extend(reversed(following))
 
         for node in self.end_nodes():
-            if node in visited:
+            if node in visited_nodes:
                 continue
-            visited.add(node)
+            visited_nodes.add(node)
             node.s = 0.0
             first_end = node.ends()[0]
             _make_directed(first_end, first_end.side == EdgeEnd.SOURCE)
 
     def to_json(self):
+        """
+        Serialize this graph. Uses orjson if it is installed, its output can differ from the json module in details
+        like the escaping of non-ASCII characters.
+
+        :return: the graph as JSON string
+        """
+        node_indices = {node: idx for idx, node in enumerate(self.nodes)}
 
         def node_to_json(node: Node):
             return {
@@ -886,8 +1303,8 @@ class Graph:
 
         def edge_to_json(edge: Edge):
             return {
-                'source': self.nodes.index(edge.source()),
-                'target': self.nodes.index(edge.target()),
+                'source': node_indices[edge.source()],
+                'target': node_indices[edge.target()],
                 'attrs': edge.attrs,
                 'segments': [{
                     'length': seg.length,
@@ -908,16 +1325,112 @@ class Graph:
                 'attrs': obj.attrs,
             }
 
-        return json.dumps({
+        data = {
             'nodes': [node_to_json(node) for node in self.nodes],
             'edges': [edge_to_json(edge) for edge in self.edges],
             'scenery_objects': [obj_to_json(obj) for obj in self.scenery_objects]
-        }, indent=2)
+        }
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS |
+                                orjson.OPT_SERIALIZE_NUMPY).decode('UTF-8')
+        return json.dumps(data, indent=2)
 
     def __repr__(self):
         return str(self.edges)
 
 
+def _reverse_local(other: Union[Vector, Pose], length: float) -> Union[Vector, Pose]:
+    """
+    Convert local coordinates of an edge to those of the flipped edge and vice versa
+
+    :param other: pose or point in local coordinates
+    :param length: way of the edge end, mapped to 0
+    :return: the converted pose or point
+    """
+    if isinstance(other, Pose):
+        return Pose(Vector(length - other.pos.x, -other.pos.y), other.direction + _PI)
+    return Vector(length - other.x, -other.y)
+
+
+def _cheaper_to_flip(first: Edge, second: Edge) -> Edge:
+    """
+    The edge with less work for Edge.flip, the second one if both are equal
+    """
+    first_cost = len(first.segments) + len(first.scenery_objects)
+    second_cost = len(second.segments) + len(second.scenery_objects)
+    return first if first_cost < second_cost else second
+
+
+class _PointIndex:
+    """
+    Nearest neighbour search in a fixed set of points. Uses a cKDTree if scipy is installed, otherwise all points are
+    compared with numpy.
+    """
+
+    def __init__(self, points: np.ndarray):
+        """
+        :param points: (N, 2) array of points
+        """
+        self.points = points
+        self.tree = cKDTree(points) if cKDTree is not None and len(points) else None
+
+    def nearest(self, x: float, y: float) -> int:
+        """
+        :return: index of the point closest to (x, y)
+        """
+        if self.tree is not None:
+            return int(self.tree.query((x, y))[1])
+        return int(np.argmin((self.points[:, 0] - x) ** 2 + (self.points[:, 1] - y) ** 2))
+
+
+class _PathIndex:
+    """
+    The ends of a graph and the ends that can follow them, in compressed sparse row form for
+    _geom_kernels.shortest_path. End 2 * i is the source end of edge i, end 2 * i + 1 its target end.
+    """
+
+    def __init__(self, graph: 'Graph'):
+        self.edges = list(graph.edges)
+        self.nodes = {node: idx for idx, node in enumerate(graph.nodes)}
+        self.edge_indices = {edge: idx for idx, edge in enumerate(self.edges)}
+        ends = [end for edge in self.edges for end in (edge.source_end, edge.target_end)]
+        indptr = [0]
+        successors = []
+        reached_nodes = []
+        for end in ends:
+            other_end = end.other_end()
+            node = other_end.node()
+            reached_nodes.append(self.nodes.get(node, -1))
+            if node is not None:
+                successors.extend(self.end_index(e) for e in node.connected_ends(other_end))
+            indptr.append(len(successors))
+        self.ends = ends
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.successors = np.array(successors, dtype=np.int64)
+        self.lengths = np.array([end.edge.length() for end in ends], dtype=float)
+        self.reached_nodes = np.array(reached_nodes, dtype=np.int64)
+
+    def end_index(self, end: End) -> int:
+        """
+        :return: index of an end in the arrays of this index
+        """
+        return 2 * self.edge_indices[end.edge] + (end.side is EdgeEnd.TARGET)
+
+    def shortest_path(self, start_ends: List[End], end_node: Node) -> 'Path':
+        """
+        Run the compiled shortest path search, see find_shortest_path
+        """
+        starts = np.array([self.end_index(end) for end in start_ends], dtype=np.int64)
+        current, predecessors = _geom_kernels.shortest_path(self.indptr, self.successors, self.lengths,
+                                                            self.reached_nodes, starts, self.nodes.get(end_node, -1))
+        indices = []
+        while current >= 0:
+            indices.append(current)
+            current = predecessors[current]
+        ends = self.ends
+        return Path(ends[idx] for idx in reversed(indices))
+
+
 class Path(List[End]):
 
     def __init__(self, ends: Iterable[End]=(), start_offset=0.0, end_offset=0.0):
@@ -939,18 +1452,11 @@ class Path(List[End]):
             offset = self[0].node().s
         offset -= self.start_offset
         for idx, end in enumerate(self):
-            flipped = False
-            if end.side == EdgeEnd.TARGET:
-                end.edge.flip()
-                flipped = True
-            try:
-                transformed = end.edge.to_global(other, offset,
-                                                 extend_before,
-                                                 extend_after and idx == len(self) - 1)
-            finally:
-                if flipped:
-                    end.edge.flip()
-            offset += end.edge.length
+            transformed = end.edge.to_global(other, offset,
+                                             extend_before,
+                                             extend_after and idx == len(self) - 1,
+                                             reverse=end.side == EdgeEnd.TARGET)
+            offset += end.edge.length()
             if transformed:
                 return transformed
 
@@ -967,17 +1473,10 @@ class Path(List[End]):
             offset = self[0].node().s
         offset -= self.start_offset
         for idx, end in enumerate(self):
-            flipped = False
-            if end.side == EdgeEnd.TARGET:
-                end.edge.flip()
-                flipped = True
-            try:
-                transformed = end.edge.to_local(other, offset,
-                                                extend_before,
-                                                extend_after and idx == len(self) - 1)
-            finally:
-                if flipped:
-                    end.edge.flip()
+            transformed = end.edge.to_local(other, offset,
+                                            extend_before,
+                                            extend_after and idx == len(self) - 1,
+                                            reverse=end.side == EdgeEnd.TARGET)
             offset += end.edge.length()
             if transformed:
                 return transformed
@@ -999,31 +1498,48 @@ class Path(List[End]):
 def find_shortest_path(start: Union[Node, End], end_node: Node):
     """
     Find the shortest path to a node.
+
+    Dijkstra's algorithm on the ends (i.e. the edges in driving direction), so only drivable paths are found.
+    Entries in the heap are not updated but skipped if a shorter way to their end has been found in the meantime.
+    If numba is installed, the search runs compiled on the cached path index of the graph.
     """
-    cnt = 0
-    heap = []
-    predecessors = {}
-    current_end: Optional[End] = None
     if isinstance(start, Node):
         start_ends = start.ends()
+        graph = start.graph
     else:
         start_ends = [start]
+        graph = start.edge.graph
+    if _geom_kernels.COMPILED and graph is not None:
+        return graph._get_path_index().shortest_path(start_ends, end_node)
+
+    cnt = 0
+    heap = []
+    predecessors = {}
+    distances: Dict[End, float] = {}
+    current_end: Optional[End] = None
     for end in start_ends:
-        heapq.heappush(heap, (end.edge.length(), cnt, end))
+        d = end.edge.length()
+        distances[end] = d
+        heapq.heappush(heap, (d, cnt, end))
         predecessors[end] = None
         cnt += 1
     while heap:
         s, _, current_end = heapq.heappop(heap)
+        if s > distances[current_end]:
+            continue
         other_end = current_end.other_end()
-        if other_end.node() == end_node:
+        node = other_end.node()
+        if node is end_node:
             break
-        for end in other_end.node().connected_ends(other_end):
-            if end not in predecessors:
+        for end in node.connected_ends(other_end):
+            d = s + end.edge.length()
+            if d < distances.get(end, math.inf):
+                distances[end] = d
                 predecessors[end] = current_end
-                heapq.heappush(heap, (s + end.edge.length(), cnt, end))
+                heapq.heappush(heap, (d, cnt, end))
                 cnt += 1
-    pth = Path()
+    ends = []
     while current_end:
-        pth.insert(0, current_end)
+        ends.append(current_end)
         current_end = predecessors[current_end]
-    return pth
+    return Path(reversed(ends))
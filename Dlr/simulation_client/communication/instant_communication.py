@@ -4,6 +4,8 @@ from simulation_client.communication.train_command_comm import CommunicationSimu
 
 
 class InstantCommunication(CommunicationSimulation):
+    __slots__ = ('commands',)
+
     def __init__(self):
         super().__init__()
         self.commands: Dict[str, float] = dict()
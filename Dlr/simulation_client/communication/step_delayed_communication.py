@@ -1,4 +1,4 @@
-from queue import Queue
+from collections import deque
 from typing import Dict
 
 import simpy
@@ -7,13 +7,17 @@ from simulation_client.communication.train_command_comm import CommunicationSimu
 
 
 class StepDelayedCommunication(CommunicationSimulation):
+    __slots__ = ('steps', 'command_q', 'receiving_commands')
+
     def __init__(self, steps=5):
         super().__init__()
-        self.command_q = Queue(steps)
+        self.steps = steps
+        # only used from the simpy process, so no synchronization is needed
+        self.command_q = deque()
 
         # fill with empty commands for initial delay
         for step in range(steps):
-            self.command_q.put(dict())
+            self.command_q.append(dict())
 
         self.receiving_commands: Dict[str, float] = dict()
 
@@ -21,10 +25,15 @@ class StepDelayedCommunication(CommunicationSimulation):
         self.receiving_commands[key] = value
 
     def get_current_commands(self):
-        return self.command_q.get()
+        return self.command_q.popleft()
 
     def run(self, simpy_env: simpy.Environment, step_size_ms: int):
         while True:
-            self.command_q.put(self.receiving_commands.copy())
+            if len(self.command_q) >= self.steps:
+                # a Queue would block here for good, and a bounded deque would drop the oldest command
+                raise RuntimeError(f"{self.steps} commands are already delayed, "
+                                   f"get_current_commands must be called once per step before the next one is added")
+            # the dict is replaced right away, so it can be queued without a copy
+            self.command_q.append(self.receiving_commands)
             self.receiving_commands = dict()
             yield simpy_env.timeout(step_size_ms)
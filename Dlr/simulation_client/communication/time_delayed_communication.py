@@ -6,6 +6,8 @@ from simulation_client.communication.train_command_comm import CommunicationSimu
 
 
 class TimeDelayedCommunication(CommunicationSimulation):
+    __slots__ = ('current_commands', 'receiving_commands', 'delay')
+
     def __init__(self, delay=1000):
         super().__init__()
 
@@ -27,7 +29,8 @@ class TimeDelayedCommunication(CommunicationSimulation):
         return self.current_commands
 
     def step(self, simpy_env):
-        command_to_send = self.receiving_commands.copy()
+        # the dict is replaced right away, so it can be sent without a copy
+        command_to_send = self.receiving_commands
         self.receiving_commands = dict()
         yield simpy_env.timeout(self.delay)
         self.current_commands = command_to_send
@@ -2,6 +2,8 @@ import simpy
 
 
 class CommunicationSimulation:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -47,6 +47,8 @@ class RGBCameraSensor(AbstractCameraSensor):
         super().__init__('rgb', width, height, fov)
 
     def decode(self, raw_data, state: dict[str, Any]):
-        return {'size': (state['width'], state['height']), 'data': raw_data}
+        # read-only view on the received bytes, RGB with one byte per channel
+        image = np.frombuffer(raw_data, dtype=np.uint8).reshape(state['height'], state['width'], 3)
+        return {'size': (state['width'], state['height']), 'data': image}
 
 
@@ -1,5 +1,6 @@
 import math
 from enum import IntEnum
+from functools import lru_cache
 from typing import Union, Iterable
 
 import numpy as np
@@ -51,6 +52,67 @@ class ObjectClassifiers(IntEnum):
     """
 
 
+@lru_cache(maxsize=8)
+def _point_layout(h_step: float, v_step: float, img_width: int, img_height: int, h_scale: float, v_scale: float):
+    """
+    Layout of the LiDAR points in the depth image. The result only depends on the sensor resolution and the image
+    properties, so it is shared by all sensors with the same configuration; the returned arrays are read-only.
+
+    :param h_step: horizontal distance of data points, in degree
+    :param v_step: vertical distance of data points, in degree
+    :param img_width: width of the depth image
+    :param img_height: height of the depth image
+    :param h_scale: horizontal scale of the projection
+    :param v_scale: vertical scale of the projection
+    :return: tuple of the indices of used points in the depth image and their direction vectors, one row per axis
+    """
+    # calculate field of view
+    h_fov = 2 * math.degrees(math.atan(1.0 / h_scale))
+    # print(f'h_fov = {h_fov}')
+    v_fov = 2 * math.degrees(math.atan(1.0 / v_scale)) # / math.sqrt(1.0 + h_scale*h_scale)))
+    # print(f'v_fov = {v_fov}')
+
+    # create initial mesh grid of horizontal and vertical angles
+    h = np.radians(np.arange(-0.5 * h_fov, 0.5 * h_fov, h_step))
+    v = np.radians(np.arange(-0.5 * v_fov, 0.5 * v_fov, v_step))
+    h_angles, v_angles = np.meshgrid(h, v)
+    h_angles = h_angles.flatten()
+    v_angles = v_angles.flatten()
+
+    # calculate direction vectors
+    fx = np.sin(h_angles) * np.cos(v_angles)
+    fy = np.sin(v_angles)
+    fz = np.cos(h_angles) * np.cos(v_angles)
+
+    # calculate positions in the projection
+    x_positions = fx / fz * h_scale
+    y_positions = fy / fz * v_scale
+
+    # filter points outside the viewport
+    # x positions are automatically within the FOV, but in the corners some y values may shoot too high or too low
+    in_view = (y_positions >= -1.0) & (y_positions <= 1.0)
+    x_positions = x_positions[in_view]
+    y_positions = y_positions[in_view]
+    fx = fx[in_view]
+    fy = fy[in_view]
+    fz = fz[in_view]
+
+    # pixel column and row of each point, rounded and clipped in place
+    column = (0.5 + 0.5 * x_positions) * img_width
+    np.rint(column, out=column)
+    np.clip(column, 0, img_width - 1, out=column)
+    row = (0.5 - 0.5 * y_positions) * img_height
+    np.rint(row, out=row)
+    np.clip(row, 0, img_height - 1, out=row)
+    # numpy index type, fancy indexing would convert smaller types on every frame
+    indices = column.astype(np.intp)
+    indices += row.astype(np.intp) * img_width
+    directions = np.vstack((fx, fy, fz))
+    indices.setflags(write=False)
+    directions.setflags(write=False)
+    return indices, directions
+
+
 class LidarSensor(AbstractCameraSensor):
     """
     Emulation of a LiDAR sensor. It is adapted from the CARLA LiDAR simulation.
@@ -104,8 +166,13 @@ class LidarSensor(AbstractCameraSensor):
         """
 
         super().__init__('depth')
-        self.width = math.ceil((1.0 / (math.tan(0.5 * h_fov) - math.tan(0.5 * h_fov - h_step)) + 1.0) / 16.0) * 32
-        self.height = math.ceil(math.tan(0.5 * v_fov) / math.tan(0.5 * h_fov) * self.width)
+        # the image resolution matches the angular step at the image border,
+        # where tan(a) - tan(a - b) = sin(b) / (cos(a) cos(a - b)) is the projected width of one step
+        half_h_fov = math.radians(0.5 * h_fov)
+        step = math.radians(h_step)
+        step_width = math.sin(step) / (math.cos(half_h_fov) * math.cos(half_h_fov - step))
+        self.width = math.ceil((1.0 / step_width + 1.0) / 16.0) * 32
+        self.height = math.ceil(math.tan(math.radians(0.5 * v_fov)) / math.tan(half_h_fov) * self.width)
         self.fov = h_fov
         self.rng = np.random.default_rng(seed)
         self.dropoff_base = dropoff_base
@@ -122,46 +189,61 @@ class LidarSensor(AbstractCameraSensor):
             self.filtered_classifiers = (ObjectClassifiers.TERRAIN, ObjectClassifiers.TRACK)
         else:
             self.filtered_classifiers = filter_ground_pane
+        self._filtered_lookup = np.zeros(8, dtype=bool)
+        """
+        Lookup table from object classification (the upper 3 bits of ID_CLS) to whether the class is filtered out
+        """
+        for cls in self.filtered_classifiers:
+            self._filtered_lookup[int(cls)] = True
 
     def _decode_data(self, raw_input: bytes):
 
-        ushorts = np.frombuffer(raw_input, dtype=RAW_DATA_DTYPE)
-        id_and_class = ushorts[0::3][self.indices]
-        distances = ushorts[1::3][self.indices] * self.max_distance / ((1 << 16) - 1)
-        intensities = ushorts[2::3][self.indices] / float((1 << 16) - 1)
-        return id_and_class, distances, intensities
+        # one row (ID_CLS, distance, intensity) per pixel, gather the used pixels at once
+        used = np.frombuffer(raw_input, dtype=RAW_DATA_DTYPE).reshape(-1, 3)[self.indices]
+        id_and_class = used[:, 0]
+        raw_distances = used[:, 1]
+        intensities = used[:, 2] * self._intensity_scale
+        return id_and_class, raw_distances, intensities
 
-    def _get_filter(self, id_and_class: np.array, distances: np.array, base_intensities: np.array):
+    def _get_filter(self, id_and_class: np.array, raw_distances: np.array, base_intensities: np.array):
         """
         Calculate a filter array for dropoff and intensities.
         The returned filter contains False for each dropped point, and True otherwise.
 
         :param id_and_class: array with object classes and IDs
-        :param distances: array with distances
+        :param raw_distances: array with distances as received from the simulator
         :param base_intensities: array with base intensities
         :return: the filter array, the calculated intensities
         """
-        mask = (id_and_class == 0)
-        for cls in self.filtered_classifiers:
-            mask |= (id_and_class >= (int(cls) << 13)) & (id_and_class < ((int(cls) + 1) << 13))
+        mask = self._filtered_lookup[id_and_class >> 13]
+        mask |= (id_and_class == 0)
 
-        masked_distances = np.ma.masked_array(distances, mask)
-        masked_intensities = np.ma.masked_array(base_intensities, mask)
-        intensities = masked_intensities * np.ma.exp(-masked_distances * self.attenuation_rate)
+        # computed for all points, the masked ones are removed by the filter
+        intensities = base_intensities * self._attenuation[raw_distances]
         if self.dropoff_intensity_limit > 0 and self.dropoff_zero_intensity > 0:
-            p_intensity_drop = ((np.ma.minimum(intensities / self.dropoff_intensity_limit, 1.0) - 1.0) *
+            p_intensity_drop = ((np.minimum(intensities / self.dropoff_intensity_limit, 1.0) - 1.0) *
                                 (-self.dropoff_zero_intensity))
         else:
             p_intensity_drop = 0.0
         p_drop = 1.0 - (1.0 - p_intensity_drop) * (1.0 - self.dropoff_base)
-        return ~mask & np.ma.greater_equal(self.rng.random(self.n_values), p_drop), intensities
+        mask = ~mask
+        mask &= self.rng.random(self.n_values) >= p_drop
+        return mask, intensities
 
     def decode(self, raw_data: bytes, config: dict):
         if self._prev_config != config:
             self._configure(config)
-        id_and_class, distances, intensities = self._decode_data(raw_data)
-        _filter, intensities = self._get_filter(id_and_class, distances, intensities)
-        return np.column_stack(((self.positions[_filter].T * distances[_filter]).T, id_and_class[_filter], intensities[_filter]))
+        id_and_class, raw_distances, intensities = self._decode_data(raw_data)
+        _filter, intensities = self._get_filter(id_and_class, raw_distances, intensities)
+        # fill the point cloud column by column instead of stacking temporary arrays
+        kept = np.flatnonzero(_filter)
+        data = np.empty((len(kept), 5))
+        kept_distances = raw_distances[kept] * self._distance_scale
+        for axis, directions in enumerate(self._directions):
+            np.multiply(directions[kept], kept_distances, out=data[:, axis])
+        data[:, 3] = id_and_class[kept]
+        data[:, 4] = intensities[kept]
+        return data
 
     def _configure(self, config: dict):
         """
@@ -171,52 +253,27 @@ class LidarSensor(AbstractCameraSensor):
         :param config: the properties of the depth data as reported by the simulation server
         :return: None
         """
-        def get_index(s, num):
-            return np.clip(np.round((0.5 + 0.5*s) * num), 0, num - 1).astype(int)
-
         self.img_height = config['height']
         self.img_width = config['width']
-        h_scale = config['h_scale']
-        v_scale = config['v_scale']
         self.max_distance = float(config['max_distance'])
+        self._distance_scale = self.max_distance / ((1 << 16) - 1)
+        self._intensity_scale = 1.0 / ((1 << 16) - 1)
+        self._attenuation = np.exp((np.arange(1 << 16) * self._distance_scale) * -self.attenuation_rate)
+        """
+        Atmosphere attenuation :math:`e^{-a \cdot D}` for each raw distance value
+        """
 
-        # calculate field of view
-        h_fov = 2 * math.degrees(math.atan(1.0 / h_scale))
-        # print(f'h_fov = {h_fov}')
-        v_fov = 2 * math.degrees(math.atan(1.0 / v_scale)) # / math.sqrt(1.0 + h_scale*h_scale)))
-        # print(f'v_fov = {v_fov}')
-
-        # create initial mesh grid of horizontal and vertical angles
-        h = np.radians(np.arange(-0.5 * h_fov, 0.5 * h_fov, self.h_step))
-        v = np.radians(np.arange(-0.5 * v_fov, 0.5 * v_fov, self.v_step))
-        h_angles, v_angles = np.meshgrid(h, v)
-        h_angles = h_angles.flatten()
-        v_angles = v_angles.flatten()
-
-        # calculate direction vectors
-        fx = np.sin(h_angles) * np.cos(v_angles)
-        fy = np.sin(v_angles)
-        fz = np.cos(h_angles) * np.cos(v_angles)
-
-        # calculate positions in the projection
-        x_positions = fx / fz * h_scale
-        y_positions = fy / fz * v_scale
-
-        # filter points outside the viewport
-        # x positions are automatically within the FOV, but in the corners some y values may shoot too high or too low
-        in_view = (y_positions >= -1.0) & (y_positions <= 1.0)
-        x_positions = x_positions[in_view]
-        y_positions = y_positions[in_view]
-        fx = fx[in_view]
-        fy = fy[in_view]
-        fz = fz[in_view]
-
-        self.indices = get_index(x_positions, self.img_width) + get_index(-y_positions, self.img_height) * self.img_width
+        indices, directions = _point_layout(self.h_step, self.v_step, self.img_width, self.img_height,
+                                            config['h_scale'], config['v_scale'])
+        self.indices = indices
         """
         The indices of used points in the raw data image
         """
-        # print(self.indices)
-        self.positions = np.column_stack((fx, fy, fz))
+        self._directions = directions
+        """
+        The direction vectors for the points in the point cloud, one contiguous row per axis
+        """
+        self.positions = self._directions.T
         """
         The direction vectors for the points in the point cloud
         """
@@ -267,6 +324,23 @@ class LidarSensor(AbstractCameraSensor):
         """
         return data[:][0:2]
 
+    @staticmethod
+    def transform_points(data, matrix) -> np.ndarray:
+        """
+        Transform the positions of LiDAR data in place, e.g. from the sensor to the world coordinate system.
+        Only the rotation/scale part and the translation of the matrix are applied, the points are not extended to
+        homogeneous coordinates.
+
+        :param data: LiDAR sensor data, modified in place
+        :param matrix: affine transformation as 3x4 or 4x4 matrix
+        :return: the transformed data
+        """
+        matrix = np.asarray(matrix)
+        xyz = data[:, 0:3]
+        xyz[...] = xyz @ matrix[0:3, 0:3].T
+        xyz += matrix[0:3, 3]
+        return data
+
     @staticmethod
     def filter_by_classification(data, cls: ObjectClassifiers, *other_cls: ObjectClassifiers) -> np.ndarray:
         """
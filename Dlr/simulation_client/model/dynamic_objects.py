@@ -19,7 +19,7 @@ class DynamicObject:
         """
         self.server = server
         self.obj = obj
-        self._commands: list[(str, dict)] = []
+        self._commands: dict[str, dict] = {}
         server.register_dynamic_object(self)
 
     def set(self, pos: Vector = None, z: float = None, pitch: float = None, yaw: float = None, roll: float = None, relative=True):
@@ -86,7 +86,9 @@ class DynamicObject:
         :param command: the command name
         :param params: the command parameters
         """
-        self._commands = [cmd for cmd in self._commands if cmd['Command'] != command] + [{'Command': command, **params}]
+        # removed first, so the new command moves to the end like a newly added one
+        self._commands.pop(command, None)
+        self._commands[command] = {'Command': command, **params}
 
     def get_and_clear_world_commands(self):
         """
@@ -94,7 +96,7 @@ class DynamicObject:
 
         :return: A copy of the list of commands
         """
-        cmds = list(self._commands)
+        cmds = list(self._commands.values())
         self._commands.clear()
         return cmds
 
@@ -131,16 +133,14 @@ class DynamicObject:
     @x.setter
     def x(self, x):
         """setter for the global x position"""
-        pos = self.obj.global_pose.pos.copy()
-        pos.x = x
-        self.set(pos=pos, relative=False)
+        pos = self.obj.global_pose.pos
+        self.set(pos=Vector(x, pos.y), relative=False)
 
     @y.setter
     def y(self, y):
         """setter for the global y position"""
-        pos = self.obj.global_pose.pos.copy()
-        pos.y = y
-        self.set(pos=pos, relative=False)
+        pos = self.obj.global_pose.pos
+        self.set(pos=Vector(pos.x, y), relative=False)
 
     @z.setter
     def z(self, z):
@@ -19,7 +19,8 @@ class Sensor:
         raise NotImplementedError()
 
     def update(self, state: immutabledict[str, object]) -> None:
-        """Update own output signal based on the current simulation state
+        """Update own output signal based on the current simulation state.
+        Different sensors may be updated in parallel threads, so implementations must not modify shared data.
 
         :param state: The state gained from the simulation
         """
@@ -1,6 +1,6 @@
+import itertools
 import logging
 import math
-import uuid
 from typing import Dict, List, Tuple
 
 from typing_extensions import Self
@@ -14,20 +14,31 @@ from routecreation.openrails_data import DEFAULT_START_TILE, TILE_SIZE
 
 SPEED = float
 
+# ids of the trains of this process, cheaper than random UUIDs
+_train_ids = itertools.count()
+
 
 class Train:
+    __slots__ = ('properties', 'id', 'is_ego', 'name', 'number', 'server', 'consist', 'route', 'path_number', 'sensors',
+                 'logger', 'commands', '_control_entries', '_pending_entries', '_accepted_values', 'location',
+                 'velocity_current_mps', 'velocity_x', 'velocity_y', 'wheelslip', 'rotation', 'acceleration',
+                 'distance_travelled', 'trackNodeOffset', 'trackNodeIndex', 'moves_backwards_on_track',
+                 'frontTrackNodeOffset', 'frontTrackNodeIndex', 'front_moves_backwards_on_track', 'communication_sim',
+                 'start_tile_x', 'start_tile_z', '_offset_x', '_offset_z')
+
     current_train_number = 0
 
     def __init__(self, server: OpenRailsServer, consist: str, route: str = None, name: str = None,
                  path_number: int = None, is_ego: bool = False,
                  communication_sim: CommunicationSimulation = None, start_tile: Tuple[int, int] = DEFAULT_START_TILE):
         self.properties = extract_properties(consist)
-        self.id = uuid.uuid4()
+        self.id = next(_train_ids)
         self.is_ego = is_ego
         self.name = name
         if not is_ego:
-            self.current_train_number += 1
-            self.number = self.current_train_number
+            # counted on the class, so each train gets its own number
+            Train.current_train_number += 1
+            self.number = Train.current_train_number
         else:
             self.number = 0
         self.server = server
@@ -38,6 +49,11 @@ class Train:
         self.logger = logging.getLogger(f"Train{' ' + name if name else ''}:{self.id}")
         server.register_train(self)
         self.commands: Dict[str, float] = dict()
+        # the control entries sent to the server, reused between steps
+        self._control_entries: Dict[str, Dict[str, object]] = dict()
+        # the entries of the last request, and the values the server has accepted
+        self._pending_entries: List[Dict[str, object]] = []
+        self._accepted_values: Dict[str, float] = dict()
         self.location: Tuple[float, float, float] = (0.0, 0.0, 0.0)
         self.velocity_current_mps = 0.0
         self.velocity_x = 0.0
@@ -59,6 +75,9 @@ class Train:
             self.communication_sim = communication_sim
 
         self.start_tile_x, self.start_tile_z = start_tile
+        # offset of the start tile, exact as tiles are integers and TILE_SIZE is a power of two
+        self._offset_x = -self.start_tile_x * TILE_SIZE
+        self._offset_z = -self.start_tile_z * TILE_SIZE
 
     def set(self,
             direction=None,
@@ -81,24 +100,52 @@ class Train:
     def set_steam(self, regulator=None):
         self._set_value("REGULATOR", regulator)
 
-    def create_json_command(self) -> List[Dict[str, float]]:
-        body: List[Dict[str, float]] = list()
-        commands = self.communication_sim.get_current_commands()
-        for key, value in commands.items():
-            body.append({"LocomotiveName": self.name, "TypeName": key, "Value": value})
+    @property
+    def server_name(self) -> str:
+        """
+        The name of this train in the server. OpenRails needs the ego train to be called "PLAYER", therefore the name
+        is replaced in the communication with the server but not in the Train object itself to ensure consistency
+        within the framework
+        """
+        return "PLAYER" if self.is_ego else self.name
 
+    def create_json_command(self) -> List[Dict[str, float]]:
+        """
+        Create the control entries for the next step. The server keeps the values of the cab controls, so only the
+        commands whose value differs from the last accepted one are included.
+
+        :return: list of control entries
+        """
+        entries = self._control_entries
+        accepted = self._accepted_values
+        body = []
+        for key, value in self.communication_sim.get_current_commands().items():
+            if accepted.get(key) == value:
+                continue
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = {"LocomotiveName": self.server_name, "TypeName": key, "Value": value}
+            else:
+                entry["Value"] = value
+            body.append(entry)
+        self._pending_entries = body
         return body
 
+    def commands_accepted(self):
+        """
+        Called after the server has accepted the entries of the last create_json_command call
+        """
+        accepted = self._accepted_values
+        for entry in self._pending_entries:
+            accepted[entry["TypeName"]] = entry["Value"]
+        self._pending_entries = []
+
     def _set_value(self, key: str, value: float):
         if value is not None:
             self.communication_sim.set_value(key, value)
 
     def _get_value(self, key: str):
-        commands = self.communication_sim.get_current_commands()
-        if key in commands.keys():
-            return commands[key]
-        else:
-            return None
+        return self.communication_sim.get_current_commands().get(key)
 
     def __str__(self):
         return f"CabCommands:\n{self.commands}"
@@ -110,31 +157,32 @@ class Train:
         sensor.server = self.server
 
     def update_state(self, state):
-        for sensor in self.sensors.values():
-            sensor.update(state)
+        self.server.update_sensors(self.sensors.values(), state)
 
-        train_name = self.name if not self.is_ego else "PLAYER"
-        own_train_state = state["trains"][train_name]
+        own_train_state = state["trains"][self.server_name]
 
         # TODO IS THIS THE CORRECT ORDER?
         self.location = self._parse_location(own_train_state["location"])
-        self.velocity_current_mps = own_train_state["locomotiveState"]["v"]
-        self.acceleration = own_train_state["locomotiveState"]["a"]
-        self.distance_travelled = own_train_state["locomotiveState"]["distance"]
-        self.wheelslip = own_train_state["locomotiveState"]["wheelslip"]
-        self.trackNodeIndex = own_train_state['rearTrackLocation']['trackNodeIndex']
-        self.trackNodeOffset = own_train_state['rearTrackLocation']['trackNodeOffset']
-        self.moves_backwards_on_track = own_train_state['rearTrackLocation']['movementDirection'] == 'Backward'
-        self.frontTrackNodeIndex = own_train_state['trackLocation']['trackNodeIndex']
-        self.frontTrackNodeOffset = own_train_state['trackLocation']['trackNodeOffset']
-        self.front_moves_backwards_on_track = own_train_state['trackLocation']['movementDirection'] == 'Backward'
-        self.rotation = own_train_state['rotation']
-
-        self.velocity_x = self.velocity_current_mps * math.cos(self.rotation)
-        self.velocity_y = self.velocity_current_mps * math.sin(self.rotation)
+        locomotive_state = own_train_state["locomotiveState"]
+        v = self.velocity_current_mps = locomotive_state["v"]
+        self.acceleration = locomotive_state["a"]
+        self.distance_travelled = locomotive_state["distance"]
+        self.wheelslip = locomotive_state["wheelslip"]
+        rear_track_location = own_train_state['rearTrackLocation']
+        self.trackNodeIndex = rear_track_location['trackNodeIndex']
+        self.trackNodeOffset = rear_track_location['trackNodeOffset']
+        self.moves_backwards_on_track = rear_track_location['movementDirection'] == 'Backward'
+        track_location = own_train_state['trackLocation']
+        self.frontTrackNodeIndex = track_location['trackNodeIndex']
+        self.frontTrackNodeOffset = track_location['trackNodeOffset']
+        self.front_moves_backwards_on_track = track_location['movementDirection'] == 'Backward'
+        rotation = self.rotation = own_train_state['rotation']
+
+        self.velocity_x = v * math.cos(rotation)
+        self.velocity_y = v * math.sin(rotation)
 
     def _parse_location(self, location):
-        offset_x = (location['tileX'] - self.start_tile_x) * TILE_SIZE
-        offset_z = (location['tileZ'] - self.start_tile_z) * TILE_SIZE
+        offset_x = location['tileX'] * TILE_SIZE + self._offset_x
+        offset_z = location['tileZ'] * TILE_SIZE + self._offset_z
         return location['x'] + offset_x, location['z'] + offset_z, location['y']
 
@@ -1,3 +1,6 @@
+import os
+import re
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -8,81 +11,94 @@ class TrainProperties:
 
 
 def extract_properties(consist) -> TrainProperties:
+    """
+    Read the properties of the engine of a consist. The files are parsed once per consist file and modification
+    time, so the returned properties are shared between trains and must not be modified.
+
+    :param consist: path of the consist (.con) file
+    :return: the train properties
+    """
+    return _extract_properties(consist, os.stat(consist).st_mtime_ns)
+
+
+@lru_cache(maxsize=128)
+def _extract_properties(consist, mtime_ns) -> TrainProperties:
     engine_path, shape_path = _get_engine_paths(consist)
 
-    with open(engine_path, "r", encoding="utf-16le") as file:
-        engine_description = file.read().strip().replace(" ", "")
+    # the files are UTF-16LE, they are searched as bytes and only the values are decoded
+    with open(engine_path, "rb") as file:
+        engine_description = file.read()
     mass = float(_get_value(engine_description, "Mass").removesuffix("t")) * 1000
 
-    with open(shape_path, "r", encoding="utf-16le") as file:
-        shape_description = file.read().strip()
-    bounding_box_values = tuple(_get_value(shape_description, "ESD_Bounding_Box").split(" "))
-
-    bounding_box = _get_bounding_box(bounding_box_values)
+    with open(shape_path, "rb") as file:
+        shape_description = file.read()
+    bounding_box = _get_bounding_box(_get_value(shape_description, "ESD_Bounding_Box"))
 
     return TrainProperties(mass, bounding_box)
 
 
 def _get_engine_paths(consist):
-    with open(consist, "r", encoding="utf-16le") as file:
+    with open(consist, "rb") as file:
         data = file.read()
 
-    # Find the first occurrence of "Engine ("
-    engine_pos = data.find("Engine (")
+    # "EngineData ( <engine> <directory> )" of the first engine
+    engine_data = _search_value(data, "EngineData")
 
-    if engine_pos == -1:
+    if engine_data is None:
         raise SyntaxError("The CON file does not specify an engine")
 
-    # Find the first occurrence of "EngineData (" after "Engine ("
-    enginedata_magic = "EngineData ("
-    enginedata_pos = data.find(enginedata_magic, engine_pos)
-
-    if enginedata_pos == -1:
-        raise SyntaxError(f"The CON file specifies an engine but no {enginedata_magic}")
-
-    # find the closing parenthesis after EngineData
-    closing_pos = data.find(")", enginedata_pos)
-
-    if closing_pos == -1:
-        raise SyntaxError("No closing parentheses found for engine data")
-
-    starting_pos = enginedata_pos + len(enginedata_magic)
-    engine_files = data[starting_pos:closing_pos].strip().removesuffix(".eng").split(" ")
+    engine_files = engine_data.split()
+    engine_name = engine_files[0].removesuffix(".eng")
     engine_dir = engine_files[1].lower()
-    engine_file = f"{engine_files[0]}.eng"
-    shape_file = f"{engine_files[0]}.sd"
+    engine_file = f"{engine_name}.eng"
+    shape_file = f"{engine_name}.sd"
     engine_path = Path(consist).parent.parent / "trainset" / engine_dir / f"{engine_file}"
     shape_path = Path(consist).parent.parent / "trainset" / engine_dir / f"{shape_file}"
 
     return engine_path, shape_path
 
 
-def _get_value(engine_description, param):
-    search_string = f"{param}("
-    param_pos = engine_description.find(search_string)
+@lru_cache(maxsize=None)
+def _value_pattern(param: str) -> re.Pattern:
+    """
+    Regular expression for the value of a parameter in UTF-16LE encoded data, e.g. "Mass ( 80t )"
 
-    if param_pos == -1:  # try again with one more whitespace
-        search_string = f"{param} ("
-        param_pos = engine_description.find(search_string)
+    :param param: the parameter name
+    :return: the compiled expression, group 1 is the encoded value
+    """
+    # the value is matched in whole characters (two bytes), so ")" is only found at character boundaries
+    return re.compile(re.escape(param.encode("utf-16le")) + rb"(?:[ \t]\x00)*\(\x00((?:..)*?)\)\x00", re.DOTALL)
 
-    if param_pos == -1:
-        raise SyntaxError(f"The ENG file does not specify parameter {param}")
 
-    closing_pos = engine_description.find(")", param_pos)
-    if closing_pos == -1:
-        raise SyntaxError(f"No closing parentheses found for param {param}")
+def _search_value(data: bytes, param: str):
+    """
+    Find the value of a parameter in UTF-16LE encoded data
+
+    :param data: the encoded data
+    :param param: the parameter name
+    :return: the value without surrounding whitespace, None if the parameter is not found
+    """
+    pattern = _value_pattern(param)
+    match = pattern.search(data)
+    # a match at an odd position combines the bytes of two characters
+    while match is not None and match.start() % 2:
+        match = pattern.search(data, match.start() + 1)
+    return None if match is None else match.group(1).decode("utf-16le").strip()
+
+
+def _get_value(engine_description: bytes, param):
+    value = _search_value(engine_description, param)
+
+    if value is None:
+        raise SyntaxError(f"The ENG file does not specify parameter {param}")
 
-    starting_pos = param_pos + len(search_string)
-    result = engine_description[starting_pos:closing_pos]
-    return result.strip()
+    return value
 
 
-def _get_bounding_box(bounding_box_values):
+def _get_bounding_box(bounding_box_text: str):
     # OpenRails Coordinates are (with, height, length) -> in python we use (length, width, height)
-    bbox_first = float(bounding_box_values[2]), float(bounding_box_values[0]), float(bounding_box_values[1])
-    bbox_second = float(bounding_box_values[5]), float(bounding_box_values[3]), float(bounding_box_values[4])
-    bounding_box = [bbox_first, bbox_second]
-    return bounding_box
+    w1, h1, l1, w2, h2, l2 = map(float, bounding_box_text.split())
+    return (l1, w1, h1), (l2, w2, h2)
 
 
 if __name__ == "__main__":
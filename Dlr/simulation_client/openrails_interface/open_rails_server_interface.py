@@ -2,26 +2,56 @@ import atexit
 import json
 import logging
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
 import threading
-import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from http import HTTPStatus
 from time import sleep
-from typing import Any, Dict
+from typing import Any, Dict, Iterable
 
 import requests
 import simpy
 from requests import Response
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it request and response bodies are handled by requests
+    orjson = None
 
 from config.constants import OR_EXEC_DIR, CONTROL_ENDPOINT, READY_ENDPOINT
-from config.log_config import get_server_connector_log, get_openrails_log
+from config.log_config import get_server_connector_log, get_openrails_log, flush_logs
 from simulation_client.model.sensor import Sensor
 from simulation_client.openrails_interface.environment import Environment
 
+# size of the connection pool to the server, also the number of threads that update sensors at once, so that each
+# thread can keep its connection alive
+HTTP_CONNECTIONS = 4
+
+
+def _write_config(directory: str, name: str, config) -> str:
+    """
+    Write a configuration for the server as compact JSON
+
+    :param directory: the directory to write to
+    :param name: the file name
+    :param config: the configuration
+    :return: the absolute path of the file
+    """
+    path = os.path.abspath(os.path.join(directory, name))
+    if orjson is not None:
+        with open(path, 'wb') as file:
+            file.write(orjson.dumps(config))
+    else:
+        with open(path, 'w') as file:
+            json.dump(config, file, separators=(',', ':'))
+    return path
 
-def _get_json_config(other_trains):
+
+def _get_json_config(other_trains, directory: str):
     config = list()
     for train in other_trains:
         config.append({
@@ -31,21 +61,17 @@ def _get_json_config(other_trains):
             "trainPath": train.path_number
         })
 
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
-        json.dump(config, temp_file, indent=4)
-        return os.path.abspath(temp_file.name)
+    return _write_config(directory, 'trains.json', config)
 
 
-def _get_sensor_config(sensors):
+def _get_sensor_config(sensors, directory: str):
     config = []
     for sensor in sensors:
         conf = sensor.get_configuration_data()
         if conf is not None:
             config.append(conf)
 
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
-        json.dump(config, temp_file, indent=4)
-        return os.path.abspath(temp_file.name)
+    return _write_config(directory, 'sensors.json', config)
 
 
 class OpenRailsServer:
@@ -78,7 +104,8 @@ class OpenRailsServer:
         self.trains = dict()
         self.dynamic_objects = []
         self.connect_to_existing = connect_to_existing
-        self._cached_get_responses = {}
+        self._cached_get_responses: Dict[str, Response] = {}
+        self._failed_get_requests: Dict[str, TimeoutError] = {}
         self.sync = sync
         self.taken_steps = 0
         self.ego_train = None
@@ -87,15 +114,41 @@ class OpenRailsServer:
         self._world_commands = []
         self.ready = False
 
+        # one keep-alive connection pool for all requests instead of a new connection per request
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=HTTP_CONNECTIONS, pool_maxsize=HTTP_CONNECTIONS))
+        self._urls: Dict[str, str] = {}
+        # threads for updating several sensors at once, most of their time is spent waiting for the server
+        self._sensor_pool = None
+        # a thread that sends the step requests in pipelined runs, see submit_step
+        self._step_pool = None
+        self._submitted_body = None
+        self._config_dir = None
+
     def setup(self):
         if not self.connect_to_existing:
             self.openrails_process = self._start_openrails()
             atexit.register(self.stop)
 
-    def run(self, simpy_env: simpy.Environment):
+    def run(self, simpy_env: simpy.Environment, pipelined: bool = False):
+        """
+        SimPy process that steps the server every step_size_ms
+
+        :param simpy_env: the simulation environment
+        :param pipelined: if `True`, the request of a step is sent before the timeout and its response is processed
+                          after it, so the other processes run while the server computes the step. They see the state
+                          of the previous step then, and their commands are sent one step later.
+        """
+        # wait once here, the steps expect a ready server
+        self._wait_until_ready()
         while True:
-            self.step()
-            yield simpy_env.timeout(self.step_size_ms)
+            if pipelined:
+                future = self.submit_step()
+                yield simpy_env.timeout(self.step_size_ms)
+                self.collect_step(future)
+            else:
+                self.step()
+                yield simpy_env.timeout(self.step_size_ms)
 
     def register_train(self, train):
         self.trains[train.name] = train
@@ -115,39 +168,60 @@ class OpenRailsServer:
         self.dynamic_objects.remove(dynamic_object)
 
     def step(self):
-        self._cached_get_responses.clear()
-
+        body = self._step_body()
+        self._step_done(body, self.post(body, CONTROL_ENDPOINT))
+
+    def submit_step(self) -> Future:
+        """
+        Send the commands of the next step without waiting for the response of the server, see collect_step.
+
+        :return: the future of the server response
+        """
+        body = self._step_body()
+        # the switch commands may be changed while the request is sent
+        body['SwitchCommands'] = dict(body['SwitchCommands'])
+        if self._step_pool is None:
+            self._step_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='step-request')
+        self._submitted_body = body
+        return self._step_pool.submit(self.post, body, CONTROL_ENDPOINT)
+
+    def collect_step(self, future: Future):
+        """
+        Wait for the response to a step sent with submit_step and update the sensors and trains with it.
+
+        :param future: the future returned by submit_step
+        """
+        self._step_done(self._submitted_body, future.result())
+
+    def _step_body(self) -> Dict[str, Any]:
         all_commands = []
         for train in self.trains.values():
-            if train.is_ego:
-                # OpenRails needs the Ego Train to be called "PLAYER", therefore the name is replaced in the command
-                #  but not in the Train object itself to ensure consistency within the framework
-                command = train.create_json_command()
-                for entry in command:
-                    entry["LocomotiveName"] = "PLAYER"
-                all_commands.extend(command)
-            else:
-                all_commands.extend(train.create_json_command())
+            # the commands of the ego train are already addressed to "PLAYER", see Train.server_name
+            all_commands.extend(train.create_json_command())
         for dynamic_object in self.dynamic_objects:
             self._world_commands.extend(dynamic_object.get_and_clear_world_commands())
-        body = {
+        return {
             'Controls': all_commands,
             'Commands': self._world_commands,
             'SwitchCommands': self.switch_setting.switch_commands if self.switch_setting else {}
         }
-        while not self._server_ready():
-            sleep(0.5)
-        response = self.post(body, CONTROL_ENDPOINT)
-        self.logger.info(f"sent command: {body}")
+
+    def _step_done(self, body: Dict[str, Any], response: Response):
+        self._cached_get_responses.clear()
+        self._failed_get_requests.clear()
+
+        # formatted by the logger only if INFO is enabled
+        self.logger.info("sent command: %s", body)
 
         if response.status_code == HTTPStatus.OK:
             self.taken_steps += 1
             self._world_commands.clear()
+            for train in self.trains.values():
+                train.commands_accepted()
 
-            state = response.json()
+            state = orjson.loads(response.content) if orjson is not None else response.json()
             try:
-                for sensor in self.sensors.values():
-                    sensor.update(state)
+                self.update_sensors(self.sensors.values(), state)
                 self.update_train_state(state)
             except KeyError as e:
                 logging.error("Server response does not meet client expectations. "
@@ -155,15 +229,18 @@ class OpenRailsServer:
                 raise e
 
         else:
-            self.logger.error(
-                f"Server did not accept command. Request was: {body}, Server response was: {response}"
-            )
+            self.logger.error("Server did not accept command. Request was: %s, Server response was: %s", body, response)
 
     def post(self, body: Any, endpoint: str, max_retries=3) -> Response:
         number_of_retries = 0
         while number_of_retries <= max_retries:
             try:
-                response = requests.post(self.build_url(endpoint), json=body, timeout=30)
+                if orjson is not None:
+                    response = self._session.post(self.build_url(endpoint),
+                                                  data=orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS),
+                                                  headers={'Content-Type': 'application/json'}, timeout=30)
+                else:
+                    response = self._session.post(self.build_url(endpoint), json=body, timeout=30)
                 return response
             except TimeoutError:
                 self.logger.warning(f"try {number_of_retries} timed out")
@@ -178,7 +255,7 @@ class OpenRailsServer:
         number_of_retries = 0
         while number_of_retries <= max_retries:
             try:
-                response = requests.get(self.build_url(endpoint), timeout=15)
+                response = self._session.get(self.build_url(endpoint), timeout=15)
                 return response
             except TimeoutError:
                 print(f"try {number_of_retries} timed out")
@@ -187,22 +264,24 @@ class OpenRailsServer:
         raise TimeoutError
 
     def get_with_cache(self, endpoint: str, *args, **kwargs) -> Response:
-        if endpoint in self._cached_get_responses:
-            response = self._cached_get_responses[endpoint]
-            if isinstance(response, TimeoutError):
-                raise TimeoutError from response
-        else:
-            try:
-                response = self.get(endpoint, *args, **kwargs)
-                self._cached_get_responses[endpoint] = response
-            except TimeoutError as e:
-                self._cached_get_responses[endpoint] = e
-                raise TimeoutError from e
+        response = self._cached_get_responses.get(endpoint)
+        if response is not None:
+            return response
+        # a timed out endpoint is not requested again in the same step
+        error = self._failed_get_requests.get(endpoint)
+        if error is not None:
+            raise TimeoutError from error
+        try:
+            response = self.get(endpoint, *args, **kwargs)
+        except TimeoutError as e:
+            self._failed_get_requests[endpoint] = e
+            raise TimeoutError from e
+        self._cached_get_responses[endpoint] = response
         return response
 
     def is_ready(self) -> bool:
         try:
-            ready = requests.get(self.build_url(READY_ENDPOINT)).status_code == HTTPStatus.OK
+            ready = self._session.get(self.build_url(READY_ENDPOINT)).status_code == HTTPStatus.OK
             if ready:
                 self.logger.info("ready")
                 return True
@@ -213,7 +292,10 @@ class OpenRailsServer:
         return False
 
     def build_url(self, endpoint: str) -> str:
-        return f"{self.host}:{self.port}/{self.api_path}/{endpoint}"
+        url = self._urls.get(endpoint)
+        if url is None:
+            url = self._urls[endpoint] = f"{self.host}:{self.port}/{self.api_path}/{endpoint}"
+        return url
 
     def _start_openrails(self):
         other_trains = list()
@@ -228,9 +310,14 @@ class OpenRailsServer:
         ego_route = (self.environment.route + r'\PATHS\{path_number}.pat').format(
             path_number=self.ego_train.path_number)
 
-        other_trains_config = _get_json_config(other_trains)
+        if self._config_dir is None:
+            # one directory per server for the configuration files, removed on exit
+            self._config_dir = tempfile.mkdtemp(prefix='openrails_')
+            atexit.register(shutil.rmtree, self._config_dir, ignore_errors=True)
+        other_trains_config = _get_json_config(other_trains, self._config_dir)
         sensors_config = _get_sensor_config(list(self.sensors.values()) +
-                                            sum((list(train.sensors.values()) for train in self.trains.values()), []))
+                                            sum((list(train.sensors.values()) for train in self.trains.values()), []),
+                                            self._config_dir)
 
         if self.sync:
             command = self.get_synced_command(ego_route, self.ego_train, other_trains_config, sensors_config)
@@ -245,8 +332,7 @@ class OpenRailsServer:
             self.or_log_thread = threading.Thread(target=self._print_logs, args=[openrails])
             self.or_log_thread.start()
 
-        while not self._server_ready():
-            time.sleep(1)
+        self._wait_until_ready(1)
 
         return openrails
 
@@ -279,33 +365,80 @@ class OpenRailsServer:
         self.ready = self.is_ready()
         return self.ready
 
+    def _wait_until_ready(self, interval: float = 0.5):
+        """
+        Block until the server has reported ready.
+
+        :param interval: seconds to wait between two requests
+        """
+        while not self._server_ready():
+            sleep(interval)
+
     def _print_logs(self, process):
         # Configure the logger to print in different color for better decidability
         openrails_log = get_openrails_log()
+        encoding = sys.stdout.encoding or 'utf-8'
 
-        while process.poll() is None:
-            raw_line = process.stdout.readline().rstrip()
+        def log_line(raw_line: bytes):
+            raw_line = raw_line.rstrip()
             try:
-                line = raw_line.decode(str(sys.stdout.encoding))  # This blocks until it receives a newline.
-                line.rstrip()
+                line = raw_line.decode(encoding)
             except UnicodeDecodeError:  # OpenRails stdout seems to be off the encoding sometimes
                 line = raw_line
             openrails_log.info(line)
-        # When the subprocess terminates there might be unconsumed output
-        # that still needs to be processed.
-        openrails_log.info(process.stdout.read())
+
+        # read whatever output is available and split it into lines, instead of one read per line
+        fd = process.stdout.fileno()
+        pending = b''
+        while True:
+            chunk = os.read(fd, 1 << 16)  # This blocks until output is available.
+            if not chunk:  # end of the output, the subprocess has terminated
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for raw_line in lines:
+                log_line(raw_line)
+        if pending:
+            log_line(pending)
 
     def stop(self):
+        if self._sensor_pool is not None:
+            self._sensor_pool.shutdown(wait=False)
+            self._sensor_pool = None
+        if self._step_pool is not None:
+            self._step_pool.shutdown(wait=False)
+            self._step_pool = None
         if self.or_log_thread:
             self.or_log_thread.join()
         if self.openrails_process.poll() is None:  # Check if the process is still running
             self.logger.info("Stopping server...")
             self.openrails_process.kill()
             self.openrails_process.wait()
+        # write out the buffered server and OpenRails output
+        flush_logs()
 
     def __del__(self):
         self.stop()
 
+    def update_sensors(self, sensors: Iterable[Sensor], state):
+        """
+        Update sensors with the current simulation state. Several sensors are updated in parallel threads, so that
+        their requests to the server overlap.
+
+        :param sensors: the sensors to update
+        :param state: the state gained from the simulation
+        """
+        sensors = list(sensors)
+        if len(sensors) < 2:
+            for sensor in sensors:
+                sensor.update(state)
+            return
+        if self._sensor_pool is None:
+            self._sensor_pool = ThreadPoolExecutor(max_workers=HTTP_CONNECTIONS, thread_name_prefix='sensor-update')
+        # consume the results, so that exceptions of the sensors are raised here
+        for _ in self._sensor_pool.map(lambda sensor: sensor.update(state), sensors):
+            pass
+
     def update_train_state(self, result):
         for name, train in self.trains.items():
             train.update_state(result)
@@ -33,5 +33,11 @@ class SwitchSetting:
     def _get_switches_per_path(self, train_paths: Dict[str, Path]) -> Dict[str, List[int]]:
         result = {}
         for train_name, path in train_paths.items():
-            result[train_name] = [end.node().attrs["or_tdb_index"] for end in path if len(end.node().ends()) > 2]
+            switches = []
+            for end in path:
+                node = end.node()
+                # the degree is the number of ends, without building and sorting them
+                if node.degree() > 2:
+                    switches.append(node.attrs["or_tdb_index"])
+            result[train_name] = switches
         return result